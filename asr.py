@@ -0,0 +1,149 @@
+import os
+import re
+from collections import deque
+
+# "auto" picks CUDA when ctranslate2 can see a GPU, otherwise CPU with int8
+# weights; 0 CPU threads lets ctranslate2 choose
+ASR_DEVICE = os.environ.get("ASR_DEVICE", "auto")
+ASR_COMPUTE_TYPE = os.environ.get("ASR_COMPUTE_TYPE", "auto")
+ASR_CPU_THREADS = int(os.environ.get("ASR_CPU_THREADS", "0"))
+ASR_NUM_WORKERS = int(os.environ.get("ASR_NUM_WORKERS", "1"))
+
+CPU_COMPUTE_TYPES = ("int8_float32", "int8", "float32")
+
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def _norm(word: str) -> str:
+    return "".join(_WORD_RE.findall(word.lower()))
+
+
+class LocalAgreement:
+    # LocalAgreement-n policy for re-decoding a growing audio window: a
+    # word is committed once the last n hypotheses agree on it, and
+    # committed words are never retracted. Everything after the committed
+    # prefix is tentative and may still change.
+
+    def __init__(self, n: int = 2):
+        self.n = n
+        self.history = deque(maxlen=n)
+        self.committed: list[str] = []
+
+    def reset(self):
+        self.history.clear()
+        self.committed = []
+
+    def update(self, text: str) -> tuple[str, str]:
+        words = text.split()
+        self.history.append(words)
+
+        if len(self.history) == self.n:
+            agreed = 0
+            for column in zip(*self.history):
+                if len({_norm(w) for w in column}) != 1:
+                    break
+                agreed += 1
+
+            if agreed > len(self.committed):
+                self.committed = list(words[:agreed])
+
+        keep = len(self.committed)
+        if [_norm(w) for w in words[:keep]] == [_norm(w) for w in self.committed]:
+            tentative = words[keep:]
+        else:
+            tentative = []
+
+        return " ".join(self.committed), " ".join(tentative)
+
+    def extend(self, continuation: str) -> tuple[str, str]:
+        # for a decode that was forced to start with the committed words
+        # as its prefix: whisper returns only what follows them
+        return self.update(" ".join(self.committed + continuation.split()))
+
+
+def detect_device() -> str:
+    import ctranslate2
+
+    try:
+        if ctranslate2.get_cuda_device_count() > 0:
+            return "cuda"
+    except RuntimeError:
+        pass
+    return "cpu"
+
+
+def default_compute_type(device: str) -> str:
+    import ctranslate2
+
+    if device == "cuda":
+        return "float16"
+
+    supported = ctranslate2.get_supported_compute_types("cpu")
+    for compute_type in CPU_COMPUTE_TYPES:
+        if compute_type in supported:
+            return compute_type
+    return "default"
+
+
+def load_whisper(
+    size: str,
+    device: str = ASR_DEVICE,
+    compute_type: str = ASR_COMPUTE_TYPE,
+    cpu_threads: int = ASR_CPU_THREADS,
+    num_workers: int = ASR_NUM_WORKERS,
+):
+    from faster_whisper import WhisperModel
+
+    if device == "auto":
+        device = detect_device()
+    if compute_type == "auto":
+        compute_type = default_compute_type(device)
+
+    print(f"[asr] loading {size} on {device} ({compute_type})")
+    return WhisperModel(
+        size,
+        device=device,
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        num_workers=num_workers,
+    )
+
+
+class TieredTranscriber:
+    # Short utterances are decoded by the fast model first and only
+    # escalated to the accurate one when any segment's avg_logprob falls
+    # below min_avg_logprob. Longer audio goes straight to the accurate
+    # model. Without a fast model this is a plain pass-through.
+
+    def __init__(
+        self,
+        fast,
+        accurate,
+        min_avg_logprob: float,
+        max_fast_sec: float,
+        sampling_rate: int = 16000,
+    ):
+        self.fast = fast
+        self.accurate = accurate
+        self.min_avg_logprob = min_avg_logprob
+        self.max_fast_samples = int(max_fast_sec * sampling_rate)
+        self.stats = {"fast": 0, "accurate": 0, "escalated": 0}
+
+    @property
+    def partial_model(self):
+        return self.fast if self.fast is not None else self.accurate
+
+    def transcribe(self, audio, **kwargs) -> tuple[list, str]:
+        if self.fast is not None and len(audio) <= self.max_fast_samples:
+            segments, _ = self.fast.transcribe(audio, **kwargs)
+            segments = list(segments)
+            if segments and all(
+                seg.avg_logprob >= self.min_avg_logprob for seg in segments
+            ):
+                self.stats["fast"] += 1
+                return segments, "fast"
+            self.stats["escalated"] += 1
+
+        segments, _ = self.accurate.transcribe(audio, **kwargs)
+        self.stats["accurate"] += 1
+        return list(segments), "accurate"
@@ -0,0 +1,390 @@
+import argparse
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+
+ASR_SERVER_HOST = "127.0.0.1"
+ASR_SERVER_PORT = 9100
+
+SAMPLE_RATE = 16000
+MODEL_SIZE = "large-v3"
+LANGUAGE = "en"
+BEAM_SIZE = 5
+
+# the batcher waits up to BATCH_WINDOW_MS after the first utterance for
+# others to arrive, then decodes at most MAX_BATCH_SIZE of them together
+MAX_BATCH_SIZE = 8
+BATCH_WINDOW_MS = 30
+
+STATS_INTERVAL_SEC = 60.0
+
+# every frame is a 4-byte big-endian length followed by the payload: the
+# client's first frame is its stream name, each later frame is one
+# utterance as mono float32 PCM, answered by one JSON frame
+_HEADER = struct.Struct("!I")
+
+RemoteSegment = namedtuple("RemoteSegment", "text avg_logprob no_speech_prob")
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes | None:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_frame(sock: socket.socket) -> bytes | None:
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    return _recv_exact(sock, size)
+
+
+def send_frame(sock: socket.socket, payload: bytes):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+class BatchTranscriber:
+    # One WhisperModel shared by every stream. Utterances up to 30 s (one
+    # whisper window) are padded to a common mel length and go through
+    # the ctranslate2 encoder and decoder as a single batch; longer ones
+    # fall back to model.transcribe on their own.
+
+    def __init__(
+        self,
+        model,
+        language: str = LANGUAGE,
+        beam_size: int = BEAM_SIZE,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        batch_window_ms: float = BATCH_WINDOW_MS,
+    ):
+        from faster_whisper.tokenizer import Tokenizer
+        from faster_whisper.transcribe import get_suppressed_tokens
+
+        self.model = model
+        self.language = language
+        self.beam_size = beam_size
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000
+
+        self.tokenizer = Tokenizer(
+            model.hf_tokenizer,
+            model.model.is_multilingual,
+            task="transcribe",
+            language=language,
+        )
+        self.prompt = list(self.tokenizer.sot_sequence) + [
+            self.tokenizer.no_timestamps
+        ]
+        self.suppress_tokens = get_suppressed_tokens(self.tokenizer, [-1])
+        self.n_frames = model.feature_extractor.nb_max_frames
+        self.max_samples = model.feature_extractor.n_samples
+
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "utterances": 0, "max_batch": 0}
+        self._thread = threading.Thread(
+            target=self._run, name="asr-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, audio: np.ndarray) -> Future:
+        future = Future()
+        self._pending.put((time.monotonic(), audio, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            started = time.monotonic()
+            try:
+                results = self._decode([audio for _, audio, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.monotonic()
+
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["utterances"] += len(batch)
+                self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+
+            for (enqueued, _, future), result in zip(batch, results):
+                result["queue_ms"] = (started - enqueued) * 1000
+                result["decode_ms"] = (finished - started) * 1000
+                result["batch_size"] = len(batch)
+                future.set_result(result)
+
+    def _features(self, audio: np.ndarray) -> np.ndarray:
+        features = self.model.feature_extractor(audio)[:, :self.n_frames]
+        if features.shape[-1] < self.n_frames:
+            features = np.pad(
+                features, [(0, 0), (0, self.n_frames - features.shape[-1])]
+            )
+        return features
+
+    def _decode(self, batch: list[np.ndarray]) -> list[dict]:
+        import ctranslate2
+
+        results = [None] * len(batch)
+        short = []
+        for i, audio in enumerate(batch):
+            if len(audio) <= self.max_samples:
+                short.append(i)
+            else:
+                results[i] = self._decode_long(audio)
+
+        if not short:
+            return results
+
+        features = np.stack([self._features(batch[i]) for i in short])
+        model = self.model.model
+        # same rule as WhisperModel.encode: with several GPUs the encoder
+        # output has to come back to the CPU
+        to_cpu = model.device == "cuda" and len(model.device_index) > 1
+        encoder_output = model.encode(
+            ctranslate2.StorageView.from_array(np.ascontiguousarray(features)),
+            to_cpu=to_cpu,
+        )
+        generated = model.generate(
+            encoder_output,
+            [self.prompt] * len(short),
+            beam_size=self.beam_size,
+            max_length=self.model.max_length,
+            return_scores=True,
+            return_no_speech_prob=True,
+            suppress_blank=True,
+            suppress_tokens=self.suppress_tokens,
+        )
+
+        for i, result in zip(short, generated):
+            tokens = result.sequences_ids[0]
+            # faster-whisper's recovery of avg_logprob (length_penalty=1)
+            avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+            results[i] = {
+                "text": self.tokenizer.decode(tokens).strip(),
+                "avg_logprob": avg_logprob,
+                "no_speech_prob": result.no_speech_prob,
+            }
+        return results
+
+    def _decode_long(self, audio: np.ndarray) -> dict:
+        segments, _ = self.model.transcribe(
+            audio,
+            language=self.language,
+            beam_size=self.beam_size,
+            condition_on_previous_text=False,
+            temperature=0.0,
+        )
+        segments = list(segments)
+        return {
+            "text": " ".join(seg.text.strip() for seg in segments),
+            "avg_logprob": min((seg.avg_logprob for seg in segments), default=0.0),
+            "no_speech_prob": max((seg.no_speech_prob for seg in segments), default=1.0),
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+class StreamStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams = {}
+
+    def add(self, stream: str, latency_ms: float, audio_sec: float):
+        with self._lock:
+            s = self._streams.setdefault(stream, {
+                "utterances": 0,
+                "audio_sec": 0.0,
+                "latency_total_ms": 0.0,
+                "latency_max_ms": 0.0,
+            })
+            s["utterances"] += 1
+            s["audio_sec"] += audio_sec
+            s["latency_total_ms"] += latency_ms
+            s["latency_max_ms"] = max(s["latency_max_ms"], latency_ms)
+
+    def format(self) -> str:
+        with self._lock:
+            streams = {k: dict(v) for k, v in self._streams.items()}
+
+        lines = ["[STREAMS]"]
+        for name, s in sorted(streams.items()):
+            avg = s["latency_total_ms"] / max(s["utterances"], 1)
+            lines.append(
+                f"  {name:<16} utterances={s['utterances']:<6} "
+                f"audio={s['audio_sec']:.1f}s "
+                f"latency={avg:.1f}/{s['latency_max_ms']:.1f}ms"
+            )
+        return "\n".join(lines)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        hello = recv_frame(self.request)
+        if hello is None:
+            return
+        stream = hello.decode("utf-8") or f"{self.client_address[0]}:{self.client_address[1]}"
+        print(f"[asr-server] stream connected: {stream}")
+
+        while True:
+            payload = recv_frame(self.request)
+            if payload is None:
+                break
+
+            received = time.monotonic()
+            audio = np.frombuffer(payload, dtype=np.float32)
+            try:
+                result = self.server.transcriber.submit(audio).result()
+            except Exception as e:
+                result = {"error": str(e)}
+
+            result["latency_ms"] = (time.monotonic() - received) * 1000
+            self.server.stream_stats.add(
+                stream, result["latency_ms"], len(audio) / SAMPLE_RATE
+            )
+            send_frame(self.request, json.dumps(result).encode("utf-8"))
+
+        print(f"[asr-server] stream disconnected: {stream}")
+
+
+class ASRServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, transcriber: BatchTranscriber):
+        super().__init__(address, _Handler)
+        self.transcriber = transcriber
+        self.stream_stats = StreamStats()
+
+
+class RemoteTranscriber:
+    # Client side, shaped like WhisperModel.transcribe so it can stand in
+    # for a final-transcript model. Decoding options (beam size, timestamps)
+    # are the server's and keyword arguments are ignored, except that a
+    # decoder prefix is refused: it cannot be honoured, so streaming
+    # partials need a local model.
+
+    def __init__(
+        self,
+        stream: str,
+        host: str = ASR_SERVER_HOST,
+        port: int = ASR_SERVER_PORT,
+        timeout: float | None = 60.0,
+    ):
+        self.stream = stream
+        self.address = (host, port)
+        self.timeout = timeout
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            send_frame(sock, self.stream.encode("utf-8"))
+            self._sock = sock
+        return self._sock
+
+    def request(self, audio: np.ndarray) -> dict:
+        payload = np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+        with self._lock:
+            try:
+                sock = self._connect()
+                send_frame(sock, payload)
+                reply = recv_frame(sock)
+            except OSError:
+                self.close()
+                raise
+            if reply is None:
+                self.close()
+                raise ConnectionError("ASR server closed the connection")
+
+        result = json.loads(reply)
+        if "error" in result:
+            raise RuntimeError(f"ASR server: {result['error']}")
+        return result
+
+    def transcribe(self, audio: np.ndarray, prefix: str | None = None, **kwargs):
+        if prefix:
+            raise ValueError("RemoteTranscriber cannot force a decoder prefix")
+        result = self.request(audio)
+        segments = []
+        if result["text"]:
+            segments.append(RemoteSegment(
+                result["text"], result["avg_logprob"], result["no_speech_prob"]
+            ))
+        return segments, result
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def main():
+    from asr import load_whisper
+
+    parser = argparse.ArgumentParser(
+        description="Serve one whisper model to many capture clients"
+    )
+    parser.add_argument("--host", default=ASR_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=ASR_SERVER_PORT)
+    parser.add_argument("--model", default=MODEL_SIZE)
+    parser.add_argument("--language", default=LANGUAGE)
+    parser.add_argument("--beam-size", type=int, default=BEAM_SIZE)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_MS)
+    args = parser.parse_args()
+
+    transcriber = BatchTranscriber(
+        load_whisper(args.model),
+        language=args.language,
+        beam_size=args.beam_size,
+        max_batch_size=args.max_batch,
+        batch_window_ms=args.window_ms,
+    )
+
+    server = ASRServer((args.host, args.port), transcriber)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"[asr-server] listening on {args.host}:{args.port}")
+
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL_SEC)
+            print(f"\n[BATCHES] {transcriber.stats()}")
+            print(server.stream_stats.format())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
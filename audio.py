@@ -0,0 +1,261 @@
+import os
+
+import numpy as np
+import torch
+
+# a vendored silero_vad.jit; leave empty to use the silero-vad package
+SILERO_VAD_PATH = os.environ.get("SILERO_VAD_PATH", "")
+
+
+class RingBuffer:
+    # Fixed-capacity sample buffer. Every sample is stored twice (at i and
+    # i + capacity) so the most recent n samples are always one contiguous
+    # slice: view() never copies. Views are only valid until the next write.
+
+    def __init__(self, capacity: int, dtype=np.float32):
+        self.capacity = capacity
+        self._buf = np.zeros(2 * capacity, dtype=dtype)
+        self._end = 0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def full(self) -> bool:
+        return self._len == self.capacity
+
+    def write(self, samples: np.ndarray):
+        n = len(samples)
+        if n >= self.capacity:
+            samples = samples[-self.capacity:]
+            n = self.capacity
+
+        cap = self.capacity
+        end = self._end
+        first = min(n, cap - end)
+
+        self._buf[end:end + first] = samples[:first]
+        self._buf[end + cap:end + cap + first] = samples[:first]
+
+        rest = n - first
+        if rest:
+            self._buf[:rest] = samples[first:]
+            self._buf[cap:cap + rest] = samples[first:]
+
+        self._end = (end + n) % cap
+        self._len = min(self._len + n, cap)
+
+    def view(self, n: int | None = None) -> np.ndarray:
+        n = self._len if n is None else min(n, self._len)
+        stop = self._end + self.capacity
+        return self._buf[stop - n:stop]
+
+    def clear(self):
+        self._end = 0
+        self._len = 0
+
+
+class StreamingVAD:
+    # Feeds Silero one fixed-size frame at a time so its recurrent state
+    # carries across calls (the same scheme as silero's VADIterator) and
+    # every sample is evaluated exactly once. process() returns
+    # ("start" | "end", sample_index) events; "end" fires after
+    # min_silence_ms of frames below the release threshold.
+
+    def __init__(
+        self,
+        model,
+        sampling_rate: int = 16000,
+        threshold: float = 0.5,
+        min_silence_ms: float = 100,
+        speech_pad_ms: float = 30,
+        frame_size: int = 512,
+    ):
+        self.model = model
+        self.sampling_rate = sampling_rate
+        self.threshold = threshold
+        self.neg_threshold = max(threshold - 0.15, 0.01)
+        self.min_silence_samples = int(sampling_rate * min_silence_ms / 1000)
+        self.speech_pad_samples = int(sampling_rate * speech_pad_ms / 1000)
+        self.frame_size = frame_size
+
+        self._frame = np.zeros(frame_size, dtype=np.float32)
+        self._frame_t = torch.from_numpy(self._frame)
+        self.reset()
+
+    def reset(self):
+        self.model.reset_states()
+        self._fill = 0
+        self.triggered = False
+        self.current_sample = 0
+        self._silence_start = 0
+        self._skipping = False
+
+    def process(self, samples: np.ndarray) -> list[tuple[str, int]]:
+        events = []
+        i = 0
+        n = len(samples)
+        while i < n:
+            take = min(self.frame_size - self._fill, n - i)
+            self._frame[self._fill:self._fill + take] = samples[i:i + take]
+            self._fill += take
+            i += take
+
+            if self._fill == self.frame_size:
+                self._fill = 0
+                event = self._step()
+                if event is not None:
+                    events.append(event)
+        self._skipping = False
+        return events
+
+    def skip(self, n: int) -> list[tuple[str, int]]:
+        # n samples the caller already knows to be silence: they advance
+        # the clock (and can end an utterance) without running the model
+        if not self._skipping and not self.triggered:
+            # the recurrent state is stale after a gap; start fresh
+            self.model.reset_states()
+            self._skipping = True
+
+        frames, self._fill = divmod(self._fill + n, self.frame_size)
+        self._frame[:self._fill] = 0.0
+
+        events = []
+        for _ in range(frames):
+            event = self._step(0.0)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _step(self, prob: float | None = None):
+        self.current_sample += self.frame_size
+
+        if prob is None:
+            with torch.no_grad():
+                prob = self.model(self._frame_t, self.sampling_rate).item()
+
+        if prob >= self.threshold:
+            self._silence_start = 0
+            if not self.triggered:
+                self.triggered = True
+                start = self.current_sample - self.frame_size
+                return "start", max(start - self.speech_pad_samples, 0)
+            return None
+
+        if self.triggered and prob < self.neg_threshold:
+            if not self._silence_start:
+                self._silence_start = self.current_sample
+            if self.current_sample - self._silence_start >= self.min_silence_samples:
+                end = self._silence_start + self.speech_pad_samples
+                self.triggered = False
+                self._silence_start = 0
+                return "end", end
+        return None
+
+
+class BatchedDenoiser:
+    # Collects capture blocks into frames of frame_samples and denoises a
+    # whole frame per call, paying model dispatch and STFT setup once per
+    # frame instead of once per 30 ms block. process() returns
+    # (raw_frame, denoised_frame) pairs, empty until a frame is complete.
+
+    def __init__(self, enhance_fn, frame_samples: int):
+        self.enhance_fn = enhance_fn
+        self.frame_samples = frame_samples
+        self._raw = np.zeros(frame_samples, dtype=np.float32)
+        self._fill = 0
+
+    def process(self, block: np.ndarray) -> list[tuple[np.ndarray, np.ndarray]]:
+        frames = []
+        i = 0
+        n = len(block)
+        while i < n:
+            take = min(self.frame_samples - self._fill, n - i)
+            self._raw[self._fill:self._fill + take] = block[i:i + take]
+            self._fill += take
+            i += take
+
+            if self._fill == self.frame_samples:
+                self._fill = 0
+                raw = self._raw.copy()
+                frames.append((raw, self.enhance_fn(raw)))
+        return frames
+
+    def flush(self) -> list[tuple[np.ndarray, np.ndarray]]:
+        if not self._fill:
+            return []
+        raw = self._raw[:self._fill].copy()
+        self._fill = 0
+        return [(raw, self.enhance_fn(raw))]
+
+
+class EnergyGate:
+    # Cheap pre-screen run on every capture block ahead of the denoiser and
+    # VAD. Blocks at or above rms_threshold open the gate; quieter blocks
+    # down to half of it still count when their zero-crossing rate looks
+    # voiced rather than like hiss. The gate stays open for hangover_blocks
+    # after the last such block so trailing speech is not cut off.
+
+    def __init__(
+        self,
+        rms_threshold: float = 0.005,
+        max_zcr: float = 0.25,
+        hangover_blocks: int = 16,
+    ):
+        self.rms_threshold = rms_threshold
+        self.max_zcr = max_zcr
+        self.hangover_blocks = hangover_blocks
+        self._hangover = 0
+        self.opened = 0
+        self.skipped = 0
+
+    def _active(self, block: np.ndarray) -> bool:
+        rms = float(np.sqrt(np.dot(block, block) / len(block)))
+        if rms >= self.rms_threshold:
+            return True
+        if rms < self.rms_threshold / 2:
+            return False
+
+        signs = np.signbit(block)
+        zcr = np.count_nonzero(signs[1:] != signs[:-1]) / len(block)
+        return zcr <= self.max_zcr
+
+    def __call__(self, block: np.ndarray) -> bool:
+        if self._active(block):
+            self._hangover = self.hangover_blocks
+            self.opened += 1
+            return True
+        if self._hangover > 0:
+            self._hangover -= 1
+            self.opened += 1
+            return True
+        self.skipped += 1
+        return False
+
+
+def hop_aligned(samples: int, hop: int) -> int:
+    return max(hop, samples // hop * hop)
+
+
+def load_vad(path: str = SILERO_VAD_PATH):
+    # vendored weights first, then the pip package (which ships its
+    # weights), then a cached torch.hub checkout; the network is last
+    if path:
+        return torch.jit.load(path, map_location="cpu")
+
+    try:
+        from silero_vad import load_silero_vad
+    except ImportError:
+        pass
+    else:
+        return load_silero_vad()
+
+    cached = os.path.join(torch.hub.get_dir(), "snakers4_silero-vad_master")
+    if os.path.isdir(cached):
+        model, _ = torch.hub.load(cached, "silero_vad", source="local")
+    else:
+        model, _ = torch.hub.load(
+            "snakers4/silero-vad", "silero_vad", trust_repo=True
+        )
+    return model
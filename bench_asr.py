@@ -0,0 +1,225 @@
+import argparse
+import ast
+import os
+import re
+import threading
+import time
+import wave
+
+import numpy as np
+
+import live_asr
+from live_asr import BLOCK_DURATION, SAMPLE_RATE, VoicePipeline
+
+# trailing silence fed after every file so the VAD can close the utterance
+TAIL_SEC = 1.5
+DRAIN_TIMEOUT_SEC = 60.0
+
+_WORD_RE = re.compile(r"[\w']+")
+
+
+def read_wav(path: str) -> np.ndarray:
+    with wave.open(path, "rb") as f:
+        width = f.getsampwidth()
+        channels = f.getnchannels()
+        rate = f.getframerate()
+        data = f.readframes(f.getnframes())
+
+    if width == 1:
+        audio = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        audio = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768
+    elif width == 4:
+        audio = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"{path}: unsupported sample width {width}")
+
+    audio = audio.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        n = int(len(audio) * SAMPLE_RATE / rate)
+        audio = np.interp(
+            np.arange(n) * rate / SAMPLE_RATE, np.arange(len(audio)), audio
+        )
+    return audio.astype(np.float32)
+
+
+def find_wavs(paths: list[str]) -> list[str]:
+    wavs = []
+    for path in paths:
+        if os.path.isdir(path):
+            wavs += sorted(
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if name.lower().endswith(".wav")
+            )
+        else:
+            wavs.append(path)
+    return wavs
+
+
+def words(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def edit_distance(ref: list[str], hyp: list[str]) -> int:
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(
+                row[j] + 1,
+                row[j - 1] + 1,
+                prev + (r != h),
+            )
+    return row[-1]
+
+
+def speech_end(audio: np.ndarray, block: int) -> int:
+    # sample index just after the last block above the energy gate
+    # threshold; used as "the speaker stopped" for latency
+    last = 0
+    for i in range(0, len(audio), block):
+        chunk = audio[i:i + block]
+        if np.sqrt(np.dot(chunk, chunk) / len(chunk)) >= live_asr.GATE_RMS_THRESHOLD:
+            last = i + len(chunk)
+    return last
+
+
+def _idle(pipeline: VoicePipeline) -> bool:
+    return all(
+        s["queued"] == 0 and s["received"] == s["processed"] + s["errors"]
+        for s in pipeline.stats()
+    )
+
+
+class Replay:
+    # Stands in for sd.InputStream: blocks go to the same audio_callback
+    # the microphone drives, paced at `speed` times real time.
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self.transcripts = []
+        self._lock = threading.Lock()
+        self.pipeline = VoicePipeline(on_transcript=self._on_transcript, on_partial=None)
+
+    def _on_transcript(self, text: str):
+        with self._lock:
+            self.transcripts.append((time.monotonic(), text))
+
+    def feed(self, audio: np.ndarray) -> dict:
+        block = int(SAMPLE_RATE * BLOCK_DURATION)
+        end = speech_end(audio, block)
+        audio = np.concatenate([audio, np.zeros(int(SAMPLE_RATE * TAIL_SEC), np.float32)])
+
+        with self._lock:
+            self.transcripts.clear()
+
+        start = time.monotonic()
+        end_at = None
+        for k, i in enumerate(range(0, len(audio) - block + 1, block)):
+            due = start + k * BLOCK_DURATION / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            self.pipeline.audio_callback(audio[i:i + block, None], block, None, None)
+            if end_at is None and i + block >= end:
+                end_at = time.monotonic()
+
+        deadline = time.monotonic() + DRAIN_TIMEOUT_SEC
+        while not _idle(self.pipeline) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        finished = time.monotonic()
+
+        with self._lock:
+            transcripts = list(self.transcripts)
+
+        return {
+            "audio_sec": len(audio) / SAMPLE_RATE,
+            "wall_sec": finished - start,
+            "text": " ".join(text for _, text in transcripts),
+            "latency_ms": (transcripts[-1][0] - end_at) * 1000
+            if transcripts and end_at is not None else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay WAV files through the live ASR pipeline"
+    )
+    parser.add_argument("paths", nargs="+", help="WAV files or directories")
+    parser.add_argument(
+        "--speed", type=float, default=1.0,
+        help="replay rate relative to real time",
+    )
+    parser.add_argument(
+        "--set", action="append", default=[], metavar="NAME=VALUE",
+        help="override a live_asr constant, e.g. VAD_THRESHOLD=0.3",
+    )
+    args = parser.parse_args()
+
+    for item in args.set:
+        name, value = item.split("=", 1)
+        if not hasattr(live_asr, name):
+            parser.error(f"live_asr has no constant {name}")
+        setattr(live_asr, name, ast.literal_eval(value))
+
+    replay = Replay(args.speed)
+    replay.pipeline.start()
+    # timings start once every model is loaded
+    live_asr.models.wait()
+    print(live_asr.models.format_timings())
+
+    errors = ref_words = 0
+    audio_total = wall_total = 0.0
+    latencies = []
+    try:
+        for path in find_wavs(args.paths):
+            result = replay.feed(read_wav(path))
+            audio_total += result["audio_sec"]
+            wall_total += result["wall_sec"]
+
+            line = f"{os.path.basename(path)}: {result['text']!r}"
+            if result["latency_ms"] is not None:
+                latencies.append(result["latency_ms"])
+                line += f"  latency={result['latency_ms']:.0f}ms"
+
+            ref_path = os.path.splitext(path)[0] + ".txt"
+            if os.path.exists(ref_path):
+                with open(ref_path, encoding="utf-8") as f:
+                    ref = words(f.read())
+                err = edit_distance(ref, words(result["text"]))
+                errors += err
+                ref_words += len(ref)
+                line += f"  wer={err / max(len(ref), 1):.2%}"
+            print(line)
+    finally:
+        replay.pipeline.stop()
+
+    stats = {s["name"]: s for s in replay.pipeline.stats()}
+    asr = stats["transcribe"]
+    asr_sec = asr["service_avg_ms"] * (asr["processed"] + asr["errors"]) / 1000
+
+    print("\n[BENCH]")
+    print(f"  audio={audio_total:.1f}s wall={wall_total:.1f}s speed={args.speed}x")
+    if audio_total:
+        print(
+            f"  rtf: transcribe stage={asr_sec / audio_total:.3f} "
+            f"end-to-end={wall_total * args.speed / audio_total:.3f}"
+        )
+    if latencies:
+        print(
+            f"  end-of-speech -> transcript: "
+            f"p50={np.percentile(latencies, 50):.0f}ms "
+            f"p90={np.percentile(latencies, 90):.0f}ms "
+            f"max={max(latencies):.0f}ms"
+        )
+    print("  dropped: " + ", ".join(
+        f"{name}={s['dropped']}" for name, s in stats.items()
+    ))
+    if ref_words:
+        print(f"  wer = {errors / ref_words:.2%} ({errors}/{ref_words} words)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+from df.enhance import enhance, init_df
+
+from audio import BatchedDenoiser, hop_aligned
+
+SAMPLE_RATE = 16000
+BLOCK_DURATION = 0.03
+
+
+def synthetic_audio(seconds: float, seed: int = 0) -> np.ndarray:
+    # tone bursts over broadband noise, roughly speech-like in level
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    tone = 0.2 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    noise = 0.05 * rng.standard_normal(len(t))
+    return (tone + noise).astype(np.float32)
+
+
+def cpu_per_audio_second(audio: np.ndarray, denoise, frame_samples: int) -> float:
+    block = int(SAMPLE_RATE * BLOCK_DURATION)
+    denoiser = BatchedDenoiser(denoise, frame_samples)
+
+    start = time.process_time()
+    for i in range(0, len(audio) - block + 1, block):
+        if frame_samples == block:
+            denoise(audio[i:i + block])
+        else:
+            denoiser.process(audio[i:i + block])
+    cpu = time.process_time() - start
+
+    return cpu / (len(audio) / SAMPLE_RATE)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="CPU cost of DeepFilterNet per block vs batched frames"
+    )
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument(
+        "--frame-sec", type=float, nargs="+", default=[0.12, 0.24, 0.48],
+    )
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    df_model, df_state, _ = init_df()
+
+    def denoise(raw):
+        audio_t = torch.from_numpy(raw).unsqueeze(0)
+        with torch.no_grad():
+            return enhance(df_model, df_state, audio_t).squeeze(0).numpy()
+
+    audio = synthetic_audio(args.seconds)
+    block = int(SAMPLE_RATE * BLOCK_DURATION)
+
+    baseline = cpu_per_audio_second(audio, denoise, block)
+    print(f"per block ({block} samples): {baseline:.3f} CPU s / audio s")
+
+    for frame_sec in args.frame_sec:
+        frame = hop_aligned(int(SAMPLE_RATE * frame_sec), df_state.hop_size())
+        cost = cpu_per_audio_second(audio, denoise, frame)
+        print(
+            f"batched ({frame} samples):  {cost:.3f} CPU s / audio s "
+            f"({baseline / cost:.1f}x less)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,1395 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import re
 import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+import profiler as _profiling
 
 DB_PATH = "database.sqlite"
 
+POOL_MAX_SIZE = 8
+POOL_IDLE_TIMEOUT_SEC = 300.0
+POOL_HEALTH_CHECK_SEC = 30.0
+POOL_ACQUIRE_TIMEOUT_SEC = 10.0
+
+# "default": plain read-only connections
+# "read_optimized": adds mmap, a larger page cache and in-memory temp
+#     storage; pair with enable_wal() so readers never block each other
+# "memory": serves reads from an in-memory copy of the database that is
+#     rebuilt when the file changes
+DB_OPEN_MODE = os.environ.get("SQL_DB_MODE", "default")
+DB_MMAP_SIZE = int(os.environ.get("SQL_DB_MMAP_SIZE", 256 * 1024 * 1024))
+DB_CACHE_SIZE_KIB = int(os.environ.get("SQL_DB_CACHE_SIZE_KIB", 64 * 1024))
+DB_TEMP_STORE = os.environ.get("SQL_DB_TEMP_STORE", "memory")
+MEMORY_REPLICA_CHECK_SEC = 2.0
+
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_MAX_ROWS = 50_000
+RESULT_CACHE_TTL_SEC = 60.0
+
+ITER_CHUNK_SIZE = 500
+# row number fetch_page adds when no key is given; stripped from pages
+PAGE_ROW_COLUMN = "_page_row"
+
+COLUMNAR_CONTENT_TYPE = "application/vnd.sql-columns"
+COLUMNAR_MAGIC = b"SQLC"
+
+PROGRESS_HANDLER_STEPS = 1000
+PROFILE_VM_STEP_INTERVAL = 100
+PROFILE_ENABLED = os.environ.get("SQL_PROFILE", "") == "1"
+
+ASYNC_DEFAULT_TIMEOUT_SEC = 10.0
+ASYNC_LANES = {
+    # lane: (worker threads, max queued + running queries)
+    "fast": (4, 64),
+    "slow": (2, 8),
+}
+
+# per-role execution budgets, enforced from inside SQLite; None disables
+# a limit. Roles without an entry use "default".
+ROLE_BUDGETS = {
+    "admin": {
+        "max_wall_sec": 10.0,
+        "max_vm_steps": 500_000_000,
+        "max_result_bytes": 16 * 1024 * 1024,
+    },
+    "sales": {
+        "max_wall_sec": 3.0,
+        "max_vm_steps": 50_000_000,
+        "max_result_bytes": 2 * 1024 * 1024,
+    },
+    "ops": {
+        "max_wall_sec": 3.0,
+        "max_vm_steps": 50_000_000,
+        "max_result_bytes": 2 * 1024 * 1024,
+    },
+    "default": {
+        "max_wall_sec": 5.0,
+        "max_vm_steps": 100_000_000,
+        "max_result_bytes": 4 * 1024 * 1024,
+    },
+}
+
+# statements containing any of these, a subquery, or a comma join go to
+# the "slow" lane so expensive analytical queries cannot starve cheap lookups
+HEAVY_KEYWORDS = {
+    "join", "group", "union", "intersect", "except",
+    "having", "over", "distinct", "recursive",
+}
+# words that end a FROM list
+FROM_LIST_END = {
+    "where", "group", "having", "window", "order", "limit",
+    "union", "intersect", "except",
+}
+
 READ_ONLY_FORBIDDEN = {
     "insert", "update", "delete",
-    "drop", "alter", "truncate", "create", "replace"
+    "drop", "alter", "truncate", "create", "replace",
+    "attach", "detach", "pragma", "vacuum", "reindex",
+}
+
+READ_ONLY_LEADING = {"select", "with", "values"}
+
+AUTHORIZER_ALLOWED = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
 }
 
+# pragmas the client itself issues on pooled connections
+AUTHORIZER_PRAGMAS = {"data_version"}
+
+
+class PoolTimeout(RuntimeError):
+    pass
+
+
+class QueryTimeout(TimeoutError):
+    pass
+
+
+class QueryCancelled(RuntimeError):
+    pass
+
+
+class QueryQueueFull(RuntimeError):
+    pass
+
+
+class QueryBudgetExceeded(RuntimeError):
+    def __init__(self, budget: str, limit, used, role: str | None = None):
+        self.budget = budget
+        self.limit = limit
+        self.used = used
+        self.role = role
+        super().__init__(
+            f"Query exceeded {budget} budget for role "
+            f"{role or 'default'}: {used} > {limit}"
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "error": "budget_exceeded",
+            "budget": self.budget,
+            "limit": self.limit,
+            "used": self.used,
+            "role": self.role,
+        }
+
+
+def _read_only_authorizer(action, arg1, arg2, db_name, trigger):
+    if action in AUTHORIZER_ALLOWED:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_PRAGMA and arg2 is None \
+            and arg1.lower() in AUTHORIZER_PRAGMAS:
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+def _file_fingerprint(path: str):
+    fp = []
+    for suffix in ("", "-wal"):
+        try:
+            st = os.stat(path + suffix)
+            fp.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            fp.append(None)
+    return tuple(fp)
+
+
+def enable_wal(path: str = DB_PATH) -> str:
+    # one-off maintenance step; the journal mode is persistent in the file
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    finally:
+        conn.close()
+
+
+class _Connection(sqlite3.Connection):
+    generation = 0
+    # last PRAGMA data_version the result cache saw on this connection
+    data_version = None
+
+
+class MemoryReplica:
+    def __init__(
+        self,
+        path: str = DB_PATH,
+        check_interval: float = MEMORY_REPLICA_CHECK_SEC,
+    ):
+        self.path = path
+        self.check_interval = check_interval
+        self.generation = 0
+        self.uri = None
+        self.refreshes = 0
+
+        self._lock = threading.Lock()
+        self._keeper = None
+        self._fingerprint = None
+        self._checked = 0.0
+
+    def refresh(self):
+        # every refresh builds a new named memory database, so readers of
+        # the previous generation keep a consistent snapshot until they are
+        # returned to the pool; the old copy is freed with its last reader
+        with self._lock:
+            old = self._refresh_locked()
+        if old is not None:
+            old.close()
+
+    def _refresh_locked(self):
+        fingerprint = _file_fingerprint(self.path)
+        generation = self.generation + 1
+        uri = (
+            f"file:sqlreplica-{os.getpid()}-{id(self)}-{generation}"
+            "?mode=memory&cache=shared"
+        )
+
+        keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        src = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            src.backup(keeper)
+        finally:
+            src.close()
+
+        old, self._keeper = self._keeper, keeper
+        self.uri = uri
+        self.generation = generation
+        self._fingerprint = fingerprint
+        self._checked = time.monotonic()
+        self.refreshes += 1
+        return old
+
+    def maybe_refresh(self) -> bool:
+        # checked and rebuilt under the lock, so concurrent callers cannot
+        # both decide to rebuild
+        with self._lock:
+            now = time.monotonic()
+            if self.uri is not None and now - self._checked < self.check_interval:
+                return False
+
+            self._checked = now
+            if self.uri is not None and \
+                    _file_fingerprint(self.path) == self._fingerprint:
+                return False
+
+            old = self._refresh_locked()
+        if old is not None:
+            old.close()
+        return True
+
+    def close(self):
+        with self._lock:
+            keeper, self._keeper = self._keeper, None
+            self.uri = None
+        if keeper is not None:
+            keeper.close()
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "last_used", "last_checked")
+
+    def __init__(self, conn: sqlite3.Connection):
+        now = time.monotonic()
+        self.conn = conn
+        self.last_used = now
+        self.last_checked = now
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        path: str = DB_PATH,
+        max_size: int = POOL_MAX_SIZE,
+        idle_timeout: float = POOL_IDLE_TIMEOUT_SEC,
+        health_check_interval: float = POOL_HEALTH_CHECK_SEC,
+        open_mode: str = DB_OPEN_MODE,
+    ):
+        if open_mode not in ("default", "read_optimized", "memory"):
+            raise ValueError(f"Unknown database open mode: {open_mode}")
+
+        self.path = path
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.open_mode = open_mode
+        self._replica = MemoryReplica(path) if open_mode == "memory" else None
+        self._generation = 0
+
+        self._cond = threading.Condition()
+        # idle connections keyed by the thread that last released them,
+        # so a thread gets its own warm connection back when possible
+        self._idle: dict = {}
+        self._open = 0
+        self._in_use = 0
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "evicted": 0,
+            "failed_health_checks": 0,
+            "waits": 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        # connections are handed between threads but only ever used by
+        # one of them at a time, which the pool guarantees
+        if self._replica is not None:
+            uri = self._replica.uri
+        else:
+            uri = f"file:{self.path}?mode=ro"
+
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            check_same_thread=False,
+            factory=_Connection,
+        )
+        conn.generation = self._generation
+
+        if self._replica is not None:
+            conn.execute("PRAGMA query_only = ON")
+        if self.open_mode == "read_optimized":
+            conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE:d}")
+            conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KIB:d}")
+        if self.open_mode != "default":
+            conn.execute(f"PRAGMA temp_store = {DB_TEMP_STORE}")
+
+        conn.set_authorizer(_read_only_authorizer)
+        return conn
+
+    def _new_generation(self):
+        # called after the memory replica was rebuilt: idle connections
+        # are dropped now, checked-out ones when they are released
+        with self._cond:
+            self._generation += 1
+            stale = list(self._idle.values())
+            self._idle.clear()
+            self._open -= len(stale)
+            self._cond.notify_all()
+        for pc in stale:
+            self._close(pc)
+
+    def _ping(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _healthy(self, pc: _PooledConnection) -> bool:
+        if not self._ping(pc.conn):
+            return False
+        pc.last_checked = time.monotonic()
+        return True
+
+    def _close(self, pc: _PooledConnection):
+        try:
+            pc.conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _evict_idle_locked(self, now: float) -> list:
+        expired = [
+            key for key, pc in self._idle.items()
+            if now - pc.last_used > self.idle_timeout
+        ]
+        evicted = [self._idle.pop(key) for key in expired]
+        self._open -= len(evicted)
+        self._stats["evicted"] += len(evicted)
+        return evicted
+
+    def acquire(self, timeout: float = POOL_ACQUIRE_TIMEOUT_SEC) -> sqlite3.Connection:
+        tid = threading.get_ident()
+        deadline = time.monotonic() + timeout
+
+        if self._replica is not None and self._replica.maybe_refresh():
+            self._new_generation()
+
+        with self._cond:
+            evicted = self._evict_idle_locked(time.monotonic())
+
+            while True:
+                pc = self._idle.pop(tid, None)
+                if pc is None and self._idle:
+                    pc = self._idle.pop(next(iter(self._idle)))
+                if pc is not None or self._open < self.max_size:
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"No database connection available after {timeout}s"
+                    )
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+
+            if pc is None:
+                self._open += 1
+            self._in_use += 1
+
+        for old in evicted:
+            self._close(old)
+
+        if pc is not None:
+            needs_check = (
+                time.monotonic() - pc.last_checked > self.health_check_interval
+            )
+            if not needs_check or self._healthy(pc):
+                with self._cond:
+                    self._stats["reused"] += 1
+                return pc.conn
+
+            self._close(pc)
+            with self._cond:
+                self._stats["failed_health_checks"] += 1
+
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection, broken: bool = False):
+        tid = threading.get_ident()
+        with self._cond:
+            self._in_use -= 1
+            if broken or conn.generation != self._generation:
+                self._open -= 1
+                discard = conn
+            else:
+                key = tid if tid not in self._idle else ("spare", id(conn))
+                self._idle[key] = _PooledConnection(conn)
+                discard = None
+            self._cond.notify()
+
+        if discard is not None:
+            try:
+                discard.close()
+            except sqlite3.Error:
+                pass
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except sqlite3.Error:
+            # bad SQL and denied statements leave the connection usable
+            broken = not self._ping(conn)
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def evict_idle(self):
+        with self._cond:
+            evicted = self._evict_idle_locked(time.monotonic())
+        for pc in evicted:
+            self._close(pc)
+        return len(evicted)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "open_mode": self.open_mode,
+                "max_size": self.max_size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self._stats,
+            }
+
+    def close(self):
+        with self._cond:
+            idle = list(self._idle.values())
+            self._idle.clear()
+            self._open -= len(idle)
+        for pc in idle:
+            self._close(pc)
+        if self._replica is not None:
+            self._replica.close()
+
+    def replica_stats(self) -> dict | None:
+        if self._replica is None:
+            return None
+        return {
+            "generation": self._replica.generation,
+            "refreshes": self._replica.refreshes,
+        }
+
+
+_pool = ConnectionPool()
+
+
+def set_open_mode(open_mode: str):
+    global _pool
+    old, _pool = _pool, ConnectionPool(open_mode=open_mode)
+    old.close()
+
+
+def pool_stats() -> dict:
+    return _pool.stats()
+
+
+_LITERAL_RE = re.compile(
+    r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|--[^\n]*|/\*.*?\*/)""",
+    re.DOTALL,
+)
+_WS_RE = re.compile(r"\s+")
+
+
+def _normalize_sql(sql: str) -> str:
+    # drop comments and collapse whitespace outside of string literals and
+    # quoted identifiers; case is kept because it decides the column names
+    # in the result
+    parts = _LITERAL_RE.split(sql)
+    for i in range(len(parts)):
+        if i % 2 == 0:
+            parts[i] = _WS_RE.sub(" ", parts[i])
+        elif parts[i].startswith(("--", "/*")):
+            parts[i] = " "
+    return "".join(parts).strip().rstrip(";").rstrip()
+
+
+class ResultCache:
+    def __init__(
+        self,
+        max_entries: int = RESULT_CACHE_SIZE,
+        max_rows: int = RESULT_CACHE_MAX_ROWS,
+        ttl: float = RESULT_CACHE_TTL_SEC,
+        path: str = DB_PATH,
+    ):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._rows = 0
+        self._fingerprint = None
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def _clear_locked(self):
+        if self._entries:
+            self._stats["invalidations"] += 1
+        self._entries.clear()
+        self._rows = 0
+
+    def validate(self, conn: _Connection):
+        # PRAGMA data_version only changes for commits made by *other*
+        # connections, so it is tracked on the connection itself; the file
+        # fingerprint catches writers in other processes
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        fingerprint = _file_fingerprint(self.path)
+
+        with self._lock:
+            previous, conn.data_version = conn.data_version, version
+
+            if fingerprint != self._fingerprint or (
+                previous is not None and previous != version
+            ):
+                self._fingerprint = fingerprint
+                self._clear_locked()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            stored_at, result = entry
+            if now - stored_at > self.ttl:
+                del self._entries[key]
+                self._rows -= len(result[1])
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return result
+
+    def put(self, key, result):
+        n = len(result[1])
+        if n > self.max_rows:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._rows -= len(old[1][1])
+
+            self._entries[key] = (time.monotonic(), result)
+            self._rows += n
+
+            while (
+                len(self._entries) > self.max_entries
+                or self._rows > self.max_rows
+            ):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._rows -= len(evicted[1])
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "rows": self._rows,
+                "max_entries": self.max_entries,
+                "max_rows": self.max_rows,
+                **self._stats,
+            }
+
+
+_cache = ResultCache()
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
+
+
+def clear_cache():
+    _cache.clear()
+
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<space>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<string>'(?:[^']|'')*'?)
+    | (?P<quoted>"(?:[^"]|"")*"?|`[^`]*`?|\[[^\]]*\]?)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<semi>;)
+    | (?P<other>.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+@lru_cache(maxsize=1024)
+def _read_only_violation(sql: str) -> str | None:
+    # single pass over the tokens; literals, comments and quoted
+    # identifiers are never inspected, so columns such as created_at or
+    # replacement_cost and strings like 'delete' are not false positives
+    first = None
+    pending = None
+    ended = False
+
+    for m in _TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind in ("space", "comment"):
+            continue
+
+        if ended:
+            return "multiple statements"
+
+        if pending is not None:
+            # replace(...) is the string function, not REPLACE INTO
+            if not (kind == "other" and m.group() == "("):
+                return pending
+            pending = None
+
+        if kind == "semi":
+            ended = True
+            continue
+
+        if kind != "word":
+            # "(SELECT 1)" is decided by the first keyword inside
+            if first is None and m.group() != "(":
+                first = m.group()
+            continue
+
+        word = m.group().lower()
+        if first is None:
+            first = word
+        if word in READ_ONLY_FORBIDDEN:
+            if word != "replace":
+                return word
+            pending = word
+
+    if pending is not None:
+        return pending
+    if first is None:
+        return "empty statement"
+    if first not in READ_ONLY_LEADING:
+        return first
+    return None
+
+
 def _enforce_read_only(sql: str):
-    s = sql.lower()
-    for kw in READ_ONLY_FORBIDDEN:
-        if kw in s:
-            raise ValueError(f"Forbidden SQL operation: {kw}")
+    violation = _read_only_violation(_normalize_sql(sql))
+    if violation is not None:
+        raise ValueError(f"Forbidden SQL operation: {violation}")
+
+
+def _columnar(columns, rows) -> dict:
+    # numpy is only needed by callers asking for columnar output
+    import numpy as np
+
+    # an empty result says nothing about its column types; object claims
+    # none, where a float64 default would
+    if not rows:
+        return {name: np.empty(0, dtype=object) for name in columns}
+
+    # zip(*rows) transposes in C; int and float columns become int64 and
+    # float64. Everything else stays object: text is not padded into a
+    # fixed-width array as wide as its longest value, and NULLs, BLOBs and
+    # mixed types are never coerced
+    result = {}
+    for name, values in zip(columns, zip(*rows)):
+        types = set(map(type, values))
+        if len(types) == 1 and types <= {int, float}:
+            result[name] = np.array(values)
+        else:
+            result[name] = np.array(values, dtype=object)
+    return result
+
+
+def _json_value(v):
+    if isinstance(v, bytes):
+        return {"base64": base64.b64encode(v).decode("ascii")}
+    return str(v)
+
+
+def _offsets_buffer(values: list[bytes]) -> bytes:
+    import numpy as np
+
+    offsets = np.zeros(len(values) + 1, dtype="<u4")
+    np.cumsum([len(v) for v in values], out=offsets[1:])
+    return offsets.tobytes() + b"".join(values)
+
+
+def _shape(columns, rows, as_tuples: bool, columnar: bool = False):
+    if columnar:
+        return _columnar(columns, rows)
+    if as_tuples:
+        # a copy, so callers cannot mutate a cached result
+        return columns, list(rows)
+    return [dict(zip(columns, r)) for r in rows]
+
+
+def encode_columnar(columns: dict, meta: dict | None = None) -> bytes:
+    # layout: magic, uint32 header length, JSON header, then one 8-byte
+    # aligned buffer per column. int64/float64 columns are raw
+    # little-endian values; text and BLOB columns are Arrow-style uint32
+    # offsets followed by UTF-8 or raw data; anything else (NULLs, mixed
+    # types) is JSON, with BLOBs as {"base64": ...}
+    specs = []
+    buffers = []
+    offset = 0
+    n_rows = 0
+
+    for name, arr in columns.items():
+        n_rows = len(arr)
+        if arr.dtype.kind == "i":
+            kind = "int64"
+            buf = arr.astype("<i8", copy=False).tobytes()
+        elif arr.dtype.kind == "f":
+            kind = "float64"
+            buf = arr.astype("<f8", copy=False).tobytes()
+        elif arr.dtype.kind == "U":
+            kind = "utf8"
+            buf = _offsets_buffer([v.encode("utf-8") for v in arr.tolist()])
+        elif len(arr) and all(isinstance(v, str) for v in arr):
+            kind = "utf8"
+            buf = _offsets_buffer([v.encode("utf-8") for v in arr])
+        elif len(arr) and all(isinstance(v, bytes) for v in arr):
+            kind = "binary"
+            buf = _offsets_buffer(list(arr))
+        else:
+            kind = "json"
+            buf = json.dumps(arr.tolist(), default=_json_value).encode("utf-8")
+
+        specs.append({
+            "name": name,
+            "type": kind,
+            "offset": offset,
+            "nbytes": len(buf),
+        })
+        pad = -len(buf) % 8
+        buffers.append(buf + b"\0" * pad)
+        offset += len(buf) + pad
+
+    header = json.dumps({
+        "rows": n_rows,
+        "columns": specs,
+        "meta": meta or {},
+    }).encode("utf-8")
+    header += b" " * (-(len(header) + 8) % 8)
+
+    return b"".join([
+        COLUMNAR_MAGIC,
+        struct.pack("<I", len(header)),
+        header,
+        *buffers,
+    ])
+
+
+def budget_for(role: str | None) -> dict:
+    return ROLE_BUDGETS.get(role or "default", ROLE_BUDGETS["default"])
+
+
+def _value_size(v) -> int:
+    if isinstance(v, (str, bytes)):
+        return len(v)
+    return 8
+
+
+class _Watchdog:
+    def __init__(
+        self,
+        timeout: float | None = None,
+        role: str | None = None,
+        budget: dict | None = None,
+    ):
+        self.role = role
+        self.budget = budget_for(role) if budget is None else budget
+        self.timeout = timeout
+
+        max_wall = self.budget.get("max_wall_sec")
+        limits = [t for t in (timeout, max_wall) if t is not None]
+        self.wall_limit = min(limits) if limits else None
+        self.deadline = (
+            None if self.wall_limit is None
+            else time.monotonic() + self.wall_limit
+        )
+        # an explicit caller timeout tighter than the role budget is
+        # reported as a timeout, not as a budget violation
+        self.budget_deadline = timeout is None or (
+            max_wall is not None and max_wall < timeout
+        )
+        self.max_steps = self.budget.get("max_vm_steps")
+        self.max_bytes = self.budget.get("max_result_bytes")
+
+        self.cancelled = threading.Event()
+        self.reason = None
+        self.interval = PROGRESS_HANDLER_STEPS
+        self.steps = 0
+        self.result_bytes = 0
+        self._earlier_steps = 0
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @property
+    def total_steps(self) -> int:
+        return self._earlier_steps + self.steps
+
+    def reset(self):
+        # starts a fresh budget, e.g. for the next chunk of a stream
+        self._earlier_steps += self.steps
+        self.steps = 0
+        self.result_bytes = 0
+        self._started = time.monotonic()
+        if self.wall_limit is not None:
+            self.deadline = self._started + self.wall_limit
+
+    def __call__(self) -> int:
+        # SQLite progress handler, invoked every `interval` VM instructions;
+        # a non-zero return aborts the statement
+        self.steps += self.interval
+        return self._should_abort()
+
+    def _should_abort(self) -> int:
+        if self.cancelled.is_set():
+            self.reason = "cancelled"
+            return 1
+        if self.max_steps is not None and self.steps > self.max_steps:
+            self.reason = "vm_steps"
+            return 1
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.reason = "wall_time" if self.budget_deadline else "timeout"
+            return 1
+        return 0
+
+    def check(self):
+        if self._should_abort():
+            self.raise_abort()
+
+    def account(self, rows):
+        if self.max_bytes is None:
+            return
+        for row in rows:
+            self.result_bytes += sum(map(_value_size, row))
+        if self.result_bytes > self.max_bytes:
+            self.reason = "result_bytes"
+            self.raise_abort()
+
+    def raise_abort(self):
+        if self.reason == "timeout":
+            raise QueryTimeout(f"Query exceeded {self.timeout}s")
+        if self.reason == "cancelled":
+            raise QueryCancelled("Query cancelled")
+        if self.reason == "wall_time":
+            used = round(time.monotonic() - self._started, 3)
+            raise QueryBudgetExceeded(
+                "wall_time", self.wall_limit, used, self.role
+            )
+        if self.reason == "vm_steps":
+            raise QueryBudgetExceeded(
+                "vm_steps", self.max_steps, self.steps, self.role
+            )
+        raise QueryBudgetExceeded(
+            "result_bytes", self.max_bytes, self.result_bytes, self.role
+        )
+
+    def attach(self, conn: sqlite3.Connection):
+        with self._lock:
+            self._conn = conn
+        conn.set_progress_handler(self, self.interval)
+
+    def detach(self, conn: sqlite3.Connection):
+        with self._lock:
+            self._conn = None
+        conn.set_progress_handler(None, 0)
+
+    def aborted(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self):
+        self.cancelled.set()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+
+
+_profiler: _profiling.QueryProfiler | None = None
+
+
+def enable_profiling(
+    path: str | None = _profiling.PROFILE_LOG_PATH,
+    ring_size: int = _profiling.PROFILE_RING_SIZE,
+    explain: bool = True,
+) -> _profiling.QueryProfiler:
+    global _profiler
+    _profiler = _profiling.QueryProfiler(path, ring_size, explain)
+    return _profiler
+
+
+def disable_profiling():
+    global _profiler
+    _profiler = None
+
+
+def recent_profiles() -> list[dict]:
+    return _profiler.recent() if _profiler is not None else []
+
+
+if PROFILE_ENABLED:
+    enable_profiling()
+
+
+def _profiling_watchdog(watchdog: _Watchdog) -> _Watchdog:
+    if _profiler is not None:
+        watchdog.interval = PROFILE_VM_STEP_INTERVAL
+    return watchdog
+
+
+def _explain(conn: sqlite3.Connection, sql: str, profiler) -> list | None:
+    if not profiler.explain:
+        return None
+    plan = profiler.cached_plan(sql)
+    if plan is None:
+        try:
+            plan = [r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        except sqlite3.Error:
+            plan = []
+        profiler.remember_plan(sql, plan)
+    return plan
+
+
+def _record_profile(profiler, sql, start, watchdog, rows, plan, cached, error):
+    if profiler is None:
+        return
+    profiler.record({
+        "ts": round(time.time(), 3),
+        "sql": sql,
+        "wall_ms": round((time.perf_counter() - start) * 1000, 3),
+        "rows": rows,
+        "vm_steps": watchdog.total_steps,
+        "cached": cached,
+        "plan": plan,
+        "error": error,
+    })
 
-def execute_sql(sql: str, max_rows: int = 100):
-    _enforce_read_only(sql)
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+def _run(
+    conn: sqlite3.Connection,
+    sql: str,
+    max_rows: int,
+    watchdog: _Watchdog,
+    params=(),
+):
+    watchdog.attach(conn)
+
     cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        columns = tuple(d[0] for d in cur.description or ())
+        # accounted chunk by chunk so an oversized result is abandoned
+        # before all of it is materialized
+        rows = []
+        while len(rows) < max_rows:
+            chunk = cur.fetchmany(min(ITER_CHUNK_SIZE, max_rows - len(rows)))
+            if not chunk:
+                break
+            watchdog.account(chunk)
+            rows += chunk
+    except sqlite3.OperationalError:
+        if watchdog.aborted():
+            watchdog.raise_abort()
+        raise
+    finally:
+        cur.close()
+        watchdog.detach(conn)
+
+    return columns, rows
+
+
+def _execute(
+    sql: str,
+    max_rows: int,
+    use_cache: bool,
+    watchdog: _Watchdog,
+):
+    normalized = _normalize_sql(sql)
+
+    profiler = _profiler
+    watchdog = _profiling_watchdog(watchdog)
+    watchdog.check()
+
+    start = time.perf_counter()
+    result = None
+    cached = False
+    plan = None
+    error = None
+
+    try:
+        with _pool.connection() as conn:
+            # a result computed under one role's budget is not reused for
+            # another, nor one read from an older memory replica
+            key = (normalized, max_rows, watchdog.role, conn.generation)
+            if use_cache:
+                _cache.validate(conn)
+                result = _cache.get(key)
+            if result is not None:
+                cached = True
+                watchdog.account(result[1])
+                return result
+
+            if profiler is not None:
+                plan = _explain(conn, normalized, profiler)
+            result = _run(conn, sql, max_rows, watchdog)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _record_profile(
+            profiler, normalized, start, watchdog,
+            len(result[1]) if result is not None else 0,
+            plan, cached, error,
+        )
+
+    if use_cache:
+        _cache.put(key, result)
+
+    return result
+
+
+def execute_sql(
+    sql: str,
+    max_rows: int = 100,
+    use_cache: bool = True,
+    as_tuples: bool = False,
+    timeout: float | None = None,
+    role: str | None = None,
+    columnar: bool = False,
+):
+    # columnar=True returns {column: numpy array} instead of rows
+    _enforce_read_only(sql)
+
+    watchdog = _Watchdog(timeout, role)
+    columns, rows = _execute(sql, max_rows, use_cache, watchdog)
+    return _shape(columns, rows, as_tuples, columnar)
+
+
+class _Lane:
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self._stats = {"submitted": 0, "completed": 0, "rejected": 0}
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise QueryQueueFull(
+                    f"{self.name} query lane is full ({self.max_pending} pending)"
+                )
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix=f"sql-{self.name}",
+                )
+            self._pending += 1
+            self._stats["submitted"] += 1
+
+        fut = self._executor.submit(fn, *args)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _done(self, fut):
+        with self._lock:
+            self._pending -= 1
+            self._stats["completed"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                **self._stats,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_lanes = {
+    name: _Lane(name, workers, max_pending)
+    for name, (workers, max_pending) in ASYNC_LANES.items()
+}
+
+
+@lru_cache(maxsize=1024)
+def _query_lane(sql: str) -> str:
+    depth = selects = 0
+    # paren depths of the FROM lists currently open
+    from_lists = []
+    for m in _TOKEN_RE.finditer(sql):
+        kind, text = m.lastgroup, m.group()
+        if kind == "word":
+            word = text.lower()
+            if word in HEAVY_KEYWORDS:
+                return "slow"
+            if word == "select":
+                selects += 1
+                if selects > 1:
+                    return "slow"
+            elif word == "from":
+                from_lists.append(depth)
+            elif word in FROM_LIST_END and from_lists and from_lists[-1] == depth:
+                from_lists.pop()
+        elif text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+            while from_lists and from_lists[-1] > depth:
+                from_lists.pop()
+        elif text == "," and from_lists and from_lists[-1] == depth:
+            return "slow"
+    return "fast"
+
+
+def lane_stats() -> dict:
+    return {name: lane.stats() for name, lane in _lanes.items()}
+
+
+async def execute_sql_async(
+    sql: str,
+    max_rows: int = 100,
+    use_cache: bool = True,
+    as_tuples: bool = False,
+    timeout: float | None = ASYNC_DEFAULT_TIMEOUT_SEC,
+    lane: str | None = None,
+    role: str | None = None,
+    columnar: bool = False,
+):
+    _enforce_read_only(sql)
+
+    if lane is None:
+        lane = _query_lane(_normalize_sql(sql))
+
+    watchdog = _Watchdog(timeout, role)
+    fut = _lanes[lane].submit(_execute, sql, max_rows, use_cache, watchdog)
+
+    try:
+        columns, rows = await asyncio.wrap_future(fut)
+    except asyncio.CancelledError:
+        fut.cancel()
+        watchdog.cancel()
+        raise
+
+    return _shape(columns, rows, as_tuples, columnar)
+
+
+def iter_sql(
+    sql: str,
+    chunk_size: int = ITER_CHUNK_SIZE,
+    as_tuples: bool = False,
+    role: str | None = None,
+):
+    # holds one pooled connection until the generator is exhausted or
+    # closed; the role budget applies to each chunk, so a long stream or a
+    # slow consumer is not aborted part-way
+    _enforce_read_only(sql)
+
+    profiler = _profiler
+    watchdog = _profiling_watchdog(_Watchdog(role=role))
+    start = time.perf_counter()
+    streamed = 0
+    plan = None
+    error = None
+
+    try:
+        with _pool.connection() as conn:
+            if profiler is not None:
+                plan = _explain(conn, _normalize_sql(sql), profiler)
+
+            watchdog.attach(conn)
+            cur = conn.cursor()
+            try:
+                cur.execute(sql)
+                columns = tuple(d[0] for d in cur.description or ())
+                while True:
+                    watchdog.reset()
+                    rows = cur.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    watchdog.account(rows)
+                    streamed += len(rows)
+                    yield _shape(columns, rows, as_tuples)
+            except sqlite3.OperationalError:
+                if watchdog.aborted():
+                    watchdog.raise_abort()
+                raise
+            finally:
+                cur.close()
+                watchdog.detach(conn)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _record_profile(
+            profiler, _normalize_sql(sql), start, watchdog,
+            streamed, plan, False, error,
+        )
+
+
+def _page_digest(sql: str, key: tuple) -> str:
+    h = hashlib.sha1(json.dumps([sql, key]).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _encode_token(digest: str, values) -> str:
+    raw = json.dumps({"h": digest, "k": list(values)}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_token(token: str, digest: str) -> list:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("Malformed continuation token")
+    if data.get("h") != digest:
+        raise ValueError("Continuation token does not belong to this query")
+    return data["k"]
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _has_order_by(sql: str) -> bool:
+    # a top-level ORDER BY, not one inside a subquery or window
+    depth = 0
+    for m in _TOKEN_RE.finditer(sql):
+        text = m.group()
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif m.lastgroup == "word" and depth == 0 and text.lower() == "order":
+            return True
+    return False
+
+
+def fetch_page(
+    sql: str,
+    page_size: int = 100,
+    key: str | tuple | None = None,
+    token: str | None = None,
+    as_tuples: bool = False,
+    role: str | None = None,
+) -> dict:
+    # keyset pagination: `key` must name result column(s) that are unique
+    # and non-NULL per row. Without one, rows are numbered in the
+    # statement's own ORDER BY (or, lacking one, in the order of all their
+    # columns) and paged on that number, which is always exact but numbers
+    # the whole result for every page
+    _enforce_read_only(sql)
+
+    inner = _normalize_sql(sql)
+    if isinstance(key, str):
+        key = (key,)
+    if key is not None:
+        key = tuple(key)
+
+    digest = _page_digest(inner, key)
+    params: list = []
+
+    if key is None:
+        if _has_order_by(inner):
+            # numbered as the ordered subquery yields its rows
+            window = "OVER ()"
+        else:
+            with _pool.connection() as conn:
+                cur = conn.execute(f"SELECT * FROM ({inner}) LIMIT 0")
+                order = ", ".join(_quote(d[0]) for d in cur.description)
+                cur.close()
+            window = f"OVER (ORDER BY {order})"
+        query = (
+            f"SELECT * FROM (SELECT *, ROW_NUMBER() {window}"
+            f" AS {PAGE_ROW_COLUMN} FROM ({inner}))"
+        )
+        if token is not None:
+            query += f" WHERE {PAGE_ROW_COLUMN} > ?"
+            params.extend(_decode_token(token, digest))
+        query += f" ORDER BY {PAGE_ROW_COLUMN} LIMIT ?"
+    else:
+        cols = ", ".join(_quote(k) for k in key)
+        query = f"SELECT * FROM ({inner})"
+        if token is not None:
+            query += f" WHERE ({cols}) > ({', '.join('?' * len(key))})"
+            params.extend(_decode_token(token, digest))
+        query += f" ORDER BY {cols} LIMIT ?"
+    params.append(page_size + 1)
+
+    watchdog = _Watchdog(role=role)
+    with _pool.connection() as conn:
+        columns, rows = _run(conn, query, page_size + 1, watchdog, params)
 
-    cur.execute(sql)
-    rows = cur.fetchmany(max_rows)
+    if key is None:
+        numbers = [r[-1] for r in rows]
+        columns = columns[:-1]
+        rows = [r[:-1] for r in rows]
+    else:
+        idx = [columns.index(k) for k in key]
+        numbers = [tuple(r[i] for i in idx) for r in rows]
+        # NULL never compares greater than the previous page's key, and a
+        # duplicate across the page boundary would be skipped
+        if any(v is None for values in numbers for v in values):
+            raise ValueError(f"Pagination key {key} contains NULL values")
+        if len(rows) > page_size and numbers[page_size - 1] == numbers[page_size]:
+            raise ValueError(f"Pagination key {key} is not unique")
 
-    conn.close()
+    next_token = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = numbers[page_size - 1]
+        next_token = _encode_token(digest, [last] if key is None else last)
 
-    return [dict(r) for r in rows]
+    if as_tuples:
+        return {"columns": columns, "rows": rows, "next_token": next_token}
+    return {"rows": _shape(columns, rows, False), "next_token": next_token}
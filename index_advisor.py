@@ -0,0 +1,286 @@
+import argparse
+import json
+import re
+import sqlite3
+import statistics
+import time
+
+from client import DB_PATH, _enforce_read_only, _normalize_sql
+from schemas import SchemaRegistry
+
+MAX_INDEX_COLUMNS = 4
+TIMING_REPEAT = 5
+
+SQL_KEYWORDS = {
+    "where", "join", "inner", "left", "right", "full", "outer", "cross",
+    "natural", "on", "using", "group", "order", "limit", "union", "having",
+    "intersect", "except", "window", "as", "select", "from", "and", "or",
+}
+
+EQ_OPS = {"=", "==", "in", "is"}
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_REF = r"(?:([A-Za-z_]\w*)\.)?([A-Za-z_]\w*)"
+_OPERAND = r"(?:([A-Za-z_]\w*)\.)?([A-Za-z_]\w*|\?|-?\d[\w.]*|\()"
+_PREDICATE_RE = re.compile(
+    _REF + r"\s*(==|=|<=|>=|<|>|\bin\b|\bis\b|\bbetween\b|\blike\b|\bglob\b)\s*"
+    + _OPERAND,
+    re.IGNORECASE,
+)
+_WORD_REF_RE = re.compile(_REF)
+_PLAN_RE = re.compile(
+    r"^(SCAN|SEARCH) (\w+)(?: USING (AUTOMATIC )?(?:PARTIAL )?(?:COVERING )?INDEX"
+    r"(?: \w+)?(?: \((.*)\))?)?"
+)
+
+
+def known_tables(db_path: str) -> dict:
+    registry = SchemaRegistry(db_path)
+    try:
+        schemas = registry.get()
+    finally:
+        registry.close()
+
+    return {
+        table.lower(): (table, list(spec["columns"]))
+        for schema in schemas.values()
+        for table, spec in schema["tables"].items()
+    }
+
+
+def load_queries(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            queries = [
+                json.loads(line)["sql"]
+                for line in f
+                if line.strip()
+            ]
+        else:
+            queries = f.read().split(";")
+
+    seen = set()
+    unique = []
+    for q in queries:
+        n = _normalize_sql(q)
+        if n and n not in seen:
+            seen.add(n)
+            unique.append(n)
+    return unique
+
+
+def _aliases(sql: str, tables: dict) -> dict:
+    words = re.findall(r"[A-Za-z_]\w*", _STRING_RE.sub("''", sql))
+    aliases = {}
+    for i, w in enumerate(words):
+        table = tables.get(w.lower())
+        if table is None:
+            continue
+        aliases[w.lower()] = table[0]
+
+        j = i + 1
+        if j < len(words) and words[j].lower() == "as":
+            j += 1
+        if j < len(words) and words[j].lower() not in SQL_KEYWORDS \
+                and words[j].lower() not in tables:
+            aliases[words[j].lower()] = table[0]
+    return aliases
+
+
+def _resolve(qualifier, column, aliases: dict, columns: dict):
+    column = column.lower()
+    if qualifier is not None:
+        table = aliases.get(qualifier.lower())
+        if table is not None and column in columns[table]:
+            return table, columns[table][column]
+        return None
+
+    owners = {t for t in set(aliases.values()) if column in columns[t]}
+    if len(owners) == 1:
+        table = owners.pop()
+        return table, columns[table][column]
+    return None
+
+
+def analyze_query(conn: sqlite3.Connection, sql: str, tables: dict) -> dict:
+    plan = [
+        row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")
+    ]
+
+    aliases = _aliases(sql, tables)
+    columns = {
+        table: {c.lower(): c for c in cols}
+        for table, cols in tables.values()
+    }
+
+    masked = _STRING_RE.sub("?", sql)
+    eq = {}
+    rng = {}
+    referenced = {}
+    star = "*" in masked
+
+    for m in _WORD_REF_RE.finditer(masked):
+        ref = _resolve(m.group(1), m.group(2), aliases, columns)
+        if ref is not None:
+            referenced.setdefault(ref[0], []).append(ref[1])
+
+    for m in _PREDICATE_RE.finditer(masked):
+        left = _resolve(m.group(1), m.group(2), aliases, columns)
+        op = m.group(3).lower()
+        right = _resolve(m.group(4), m.group(5), aliases, columns) \
+            if m.group(5) not in ("?", "(") else None
+
+        # only column-vs-value filters; join columns show up in the plan
+        # as AUTOMATIC indexes on the inner table instead
+        for ref, other in ((left, right), (right, left)):
+            if ref is None or other is not None:
+                continue
+            target = eq if op in EQ_OPS else rng
+            target.setdefault(ref[0], []).append(ref[1])
+
+    proposals = []
+    for detail in plan:
+        m = _PLAN_RE.match(detail)
+        if m is None:
+            continue
+        kind, name, automatic, index_cols = m.groups()
+        table = aliases.get(name.lower())
+        if table is None:
+            continue
+
+        if automatic and index_cols:
+            keys = [
+                columns[table][c.split("=")[0].strip().lower()]
+                for c in index_cols.split(" AND ")
+                if c.split("=")[0].strip().lower() in columns[table]
+            ]
+        elif kind == "SCAN" and index_cols is None and "USING" not in detail:
+            keys = list(dict.fromkeys(eq.get(table, [])))
+            keys += [c for c in rng.get(table, []) if c not in keys][:1]
+        else:
+            continue
+
+        if not keys:
+            continue
+
+        if not star:
+            extra = [
+                c for c in dict.fromkeys(referenced.get(table, []))
+                if c not in keys
+            ]
+            if len(keys) + len(extra) <= MAX_INDEX_COLUMNS:
+                keys += extra
+
+        proposals.append((table, tuple(keys)))
+
+    return {"sql": sql, "plan": plan, "proposals": proposals}
+
+
+def merge_proposals(proposals) -> list[tuple]:
+    merged = []
+    for table, cols in sorted(set(proposals), key=lambda p: -len(p[1])):
+        covered = any(
+            t == table and c[:len(cols)] == cols
+            for t, c in merged
+        )
+        if not covered:
+            merged.append((table, cols))
+    return sorted(merged)
+
+
+def index_ddl(table: str, cols: tuple) -> str:
+    name = "idx_" + table.lower() + "_" + "_".join(c.lower() for c in cols)
+    return (
+        f'CREATE INDEX IF NOT EXISTS "{name}" '
+        f'ON "{table}" ({", ".join(chr(34) + c + chr(34) for c in cols)})'
+    )
+
+
+def time_query(conn: sqlite3.Connection, sql: str, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def advise(db_path: str, queries: list[str]):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        tables = known_tables(db_path)
+        analyses = []
+        for sql in queries:
+            try:
+                _enforce_read_only(sql)
+                analyses.append(analyze_query(conn, sql, tables))
+            except (ValueError, sqlite3.Error) as e:
+                print(f"[skipped] {sql}\n  {e}")
+    finally:
+        conn.close()
+
+    proposals = merge_proposals(
+        p for a in analyses for p in a["proposals"]
+    )
+    return analyses, proposals
+
+
+def apply_indexes(db_path: str, queries: list[str], proposals, repeat: int):
+    conn = sqlite3.connect(db_path)
+    try:
+        before = {q: time_query(conn, q, repeat) for q in queries}
+
+        with conn:
+            for table, cols in proposals:
+                conn.execute(index_ddl(table, cols))
+        conn.execute("ANALYZE")
+
+        after = {q: time_query(conn, q, repeat) for q in queries}
+    finally:
+        conn.close()
+
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Propose (and optionally build) indexes for logged SQL"
+    )
+    parser.add_argument("log", help=".sql file or .jsonl log with a 'sql' field")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument(
+        "--apply", action="store_true",
+        help="maintenance mode: create the indexes and report timings",
+    )
+    parser.add_argument("--repeat", type=int, default=TIMING_REPEAT)
+    args = parser.parse_args()
+
+    queries = load_queries(args.log)
+    analyses, proposals = advise(args.db, queries)
+
+    for a in analyses:
+        print(f"\n[QUERY] {a['sql']}")
+        for detail in a["plan"]:
+            print(f"  plan: {detail}")
+
+    print("\n[PROPOSED INDEXES]")
+    if not proposals:
+        print("(none)")
+        return
+    for table, cols in proposals:
+        print(index_ddl(table, cols) + ";")
+
+    if not args.apply:
+        return
+
+    queries = [a["sql"] for a in analyses]
+    before, after = apply_indexes(args.db, queries, proposals, args.repeat)
+
+    print("\n[TIMINGS] median ms before -> after")
+    for q in queries:
+        speedup = before[q] / after[q] if after[q] else float("inf")
+        print(f"{before[q]:9.3f} -> {after[q]:9.3f}  ({speedup:5.1f}x)  {q}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,44 @@
 import os
-os.environ["CUDA_VISIBLE_DEVICES"] = ""
 from client import execute_sql
 
 import sounddevice as sd
 import numpy as np
 import torch
-from faster_whisper import WhisperModel
-import queue
-import requests
-from df.enhance import enhance, init_df
+import time
+import socket
+
+from asr import LocalAgreement, TieredTranscriber, load_whisper
+from asr_server import RemoteTranscriber
+from nl_sql import NLSQLClient, TranscriptCache
+from router import SEMANTIC_ROUTING, detect_schema, is_schema_word, semantic_router
+from audio import (
+    BatchedDenoiser, EnergyGate, RingBuffer, StreamingVAD, hop_aligned, load_vad
+)
+from pipeline import BackgroundLoader, Stage, format_stats
 
 torch.set_num_threads(1)
 
 NL_SQL_ENDPOINT = "http://192.168.137.1:9000/generate_sql"
 NL_SQL_ROLE = "admin"
+MAX_PRINT_ROWS = 100
+# send the NL->SQL request as soon as the partial transcript is fully
+# agreed on, so the SQL is often back by the time the speaker stops
+SPECULATIVE_NL_SQL = True
+
+nl_sql = NLSQLClient(NL_SQL_ENDPOINT, role=NL_SQL_ROLE)
+sql_cache = TranscriptCache(vocabulary=is_schema_word)
+
+
+def on_partial_transcript(committed: str, tentative: str):
+    print(f"\r[partial] {committed} \u2039{tentative}\u203a", end="")
+    if (
+        SPECULATIVE_NL_SQL
+        and committed
+        and not tentative
+        and not sql_cache.has(committed, NL_SQL_ROLE, detect_schema(committed))
+    ):
+        nl_sql.speculate(committed)
+
 
 def on_final_transcript(text: str):
     text = text.strip()
@@ -23,17 +48,15 @@ def on_final_transcript(text: str):
     print("\n[VOICE QUERY]")
     print(text)
 
+    cached = False
     try:
-        r = requests.post(
-            NL_SQL_ENDPOINT,
-            json={
-                "question": text,
-                "role": NL_SQL_ROLE
-            },
-            timeout=10
-        )
-        r.raise_for_status()
-        data = r.json()
+        schema = detect_schema(text)
+        data = sql_cache.get(text, NL_SQL_ROLE, schema)
+        cached = data is not None
+        if cached:
+            print("\n[SQL CACHE HIT]")
+        else:
+            data = nl_sql.resolve(text)
 
         if data.get("intent") != "sql":
             print("\n[NL→SQL RESPONSE]")
@@ -45,16 +68,25 @@ def on_final_transcript(text: str):
         print("\n[SQL]")
         print(sql)
 
-        rows = execute_sql(sql)
-
         print("\n[RESULTS]")
+        # one row past the limit tells whether the output was truncated;
+        # repeated questions are answered from the result cache
+        rows = execute_sql(sql, max_rows=MAX_PRINT_ROWS + 1, role=NL_SQL_ROLE)
+        for row in rows[:MAX_PRINT_ROWS]:
+            print(row)
+        if len(rows) > MAX_PRINT_ROWS:
+            print(f"... (more than {MAX_PRINT_ROWS} rows, output truncated)")
+
         if not rows:
             print("(no rows)")
-        else:
-            for row in rows:
-                print(row)
+
+        # only SQL that validated and ran is worth reusing
+        if not cached:
+            sql_cache.put(text, NL_SQL_ROLE, schema, data)
 
     except Exception as e:
+        if cached:
+            sql_cache.discard(text, NL_SQL_ROLE, schema)
         print("\n[ERROR]")
         print(e)
 
@@ -62,7 +94,16 @@ def on_final_transcript(text: str):
 SAMPLE_RATE = 16000
 BLOCK_DURATION = 0.03
 
-MODEL_SIZE = "large-v3"
+MODEL_SIZE = os.environ.get("ASR_MODEL", "large-v3")
+BEAM_SIZE = 5
+# utterances up to SHORT_COMMAND_SEC are tried on this model first and only
+# re-decoded with MODEL_SIZE when it is not confident; "" disables tiering
+FAST_MODEL_SIZE = os.environ.get("ASR_FAST_MODEL", "small")
+SHORT_COMMAND_SEC = 8.0
+# "host:port" of a shared asr_server.py; when set no whisper model is
+# loaded in this process
+ASR_SERVER = os.environ.get("ASR_SERVER", "")
+ASR_STREAM = os.environ.get("ASR_STREAM", socket.gethostname())
 
 MIN_SPEECH_SEC = 0.5
 MAX_SPEECH_SEC = 30.0
@@ -70,43 +111,92 @@ MAX_SPEECH_SEC = 30.0
 MIN_AVG_LOGPROB = -0.6
 MAX_NO_SPEECH_PROB = 0.6
 
-VAD_WINDOW_SEC = 0.4
+VAD_THRESHOLD = 0.2
+PRE_ROLL_SEC = 0.4
 SILENCE_END_SEC = 0.6
 
 MAX_SAMPLES = int(SAMPLE_RATE * MAX_SPEECH_SEC)
 
+# DeepFilterNet runs on frames of this length (rounded down to its hop
+# size) instead of on every 30 ms block; longer frames cost less CPU per
+# second of audio but delay VAD decisions by up to one frame
+DENOISE_FRAME_SEC = 0.24
+
+# blocks quieter than this skip DeepFilterNet and Silero entirely; the
+# hangover keeps the models running briefly after the last loud block
+GATE_RMS_THRESHOLD = 0.005
+GATE_MAX_ZCR = 0.25
+GATE_HANGOVER_SEC = 0.5
+
+# while someone is speaking, re-decode the growing utterance this often
+# and report the words two consecutive decodes agree on. Off with an ASR
+# server: it decodes with its own options and cannot force the agreed prefix
+STREAMING_PARTIALS = not ASR_SERVER
+PARTIAL_INTERVAL_SEC = 0.5
+PARTIAL_AGREEMENT = 2
+
+# bounded queue in front of each pipeline stage
+CAPTURE_QUEUE_BLOCKS = 100
+SEGMENT_QUEUE_FRAMES = 20
+ASR_QUEUE_UTTERANCES = 4
+SQL_QUEUE_TRANSCRIPTS = 8
+
+# capture starts before the models are loaded; until they are, the capture
+# queue holds up to this much audio instead of CAPTURE_QUEUE_BLOCKS
+STARTUP_BUFFER_SEC = 60.0
+
+STATS_INTERVAL_SEC = 60.0
+
 sd.default.samplerate = SAMPLE_RATE
 sd.default.channels = 1
 sd.default.device = (1, None)
 
-audio_q = queue.Queue(maxsize=30)
 
-whisper = WhisperModel(
-    MODEL_SIZE,
-    device="cuda",
-    compute_type="float16"
-)
 
-df_model, df_state, _ = init_df()
+def _load_whisper():
+    if ASR_SERVER:
+        host, port = ASR_SERVER.rsplit(":", 1)
+        return RemoteTranscriber(ASR_STREAM, host, int(port))
+    return load_whisper(MODEL_SIZE)
 
-vad_model, utils = torch.hub.load(
-    "snakers4/silero-vad",
-    "silero_vad",
-    trust_repo=True
-)
-(get_speech_timestamps, _, _, _, _) = utils
 
+def _load_fast_whisper():
+    if ASR_SERVER or not FAST_MODEL_SIZE:
+        return None
+    return load_whisper(FAST_MODEL_SIZE)
 
-def audio_callback(indata, frames, time_info, status):
-    if status:
-        print(status)
 
-    raw = indata.copy().flatten().astype(np.float32)
+def _load_transcriber():
+    return TieredTranscriber(
+        models.get("fast_whisper"),
+        models.get("whisper"),
+        min_avg_logprob=MIN_AVG_LOGPROB,
+        max_fast_sec=SHORT_COMMAND_SEC,
+        sampling_rate=SAMPLE_RATE,
+    )
 
-    try:
-        audio_q.put_nowait(raw)
-    except queue.Full:
-        pass
+
+def _load_deepfilternet():
+    # DeepFilterNet and Silero stay on CPU (Silero is loaded there
+    # already); the GPU is left to whisper, see asr.load_whisper. df reads
+    # DEVICE on every enhance() call, so it is set for the process
+    os.environ.setdefault("DEVICE", "cpu")
+    from df.enhance import enhance, init_df
+
+    df_model, df_state, _ = init_df()
+    return enhance, df_model, df_state
+
+
+# nothing is loaded at import; every model loads on its own thread once
+# models.start() is called (VoicePipeline.start does)
+models = BackgroundLoader()
+models.register("whisper", _load_whisper)
+models.register("fast_whisper", _load_fast_whisper)
+models.register("transcriber", _load_transcriber)
+models.register("deepfilternet", _load_deepfilternet)
+models.register("silero_vad", load_vad)
+if SEMANTIC_ROUTING:
+    models.register("schema_router", semantic_router)
 
 
 def is_confident_segment(seg) -> bool:
@@ -117,102 +207,260 @@ def is_confident_segment(seg) -> bool:
     return True
 
 
-buffer = np.zeros(0, dtype=np.float32)
-vad_buffer = np.zeros(0, dtype=np.float32)
+def denoise(raw: np.ndarray) -> np.ndarray:
+    enhance, df_model, df_state = models.get("deepfilternet")
+    audio_t = torch.from_numpy(raw).unsqueeze(0)
+    with torch.no_grad():
+        denoised_t = enhance(df_model, df_state, audio_t)
+    return denoised_t.squeeze(0).numpy()
+
+
+def transcribe_partial(audio: np.ndarray, prefix: str) -> str:
+    # greedy and without timestamps: partials only need to be fast; the
+    # committed words are forced as the decoder prefix so they stay put,
+    # and only the text after them is returned
+    segments, _ = models.get("transcriber").partial_model.transcribe(
+        audio,
+        beam_size=1,
+        condition_on_previous_text=False,
+        temperature=0.0,
+        without_timestamps=True,
+        prefix=prefix or None,
+    )
+    return " ".join(seg.text.strip() for seg in segments)
+
+
+def transcribe(audio: np.ndarray) -> str | None:
+    segments, _ = models.get("transcriber").transcribe(
+        audio,
+        beam_size=BEAM_SIZE,
+        condition_on_previous_text=False,
+        temperature=0.0,
+        no_speech_threshold=0.6,
+    )
+
+    texts = [
+        seg.text for seg in segments
+        if is_confident_segment(seg)
+    ]
+
+    if not texts:
+        print("\n[discarded low-confidence audio]")
+        return None
+    return " ".join(texts)
+
+
+class Segmenter:
+    def __init__(self, emit, emit_partial=None):
+        self.emit = emit
+        self.emit_partial = emit_partial
+        self._since_partial = 0
+        self.buffer = RingBuffer(MAX_SAMPLES)
+        # raw audio from just before the VAD fires, so onsets are not clipped
+        self.pre_roll = RingBuffer(int(SAMPLE_RATE * PRE_ROLL_SEC))
+        self.vad = StreamingVAD(
+            models.get("silero_vad"),
+            sampling_rate=SAMPLE_RATE,
+            threshold=VAD_THRESHOLD,
+            min_silence_ms=SILENCE_END_SEC * 1000,
+        )
+        self.speaking = False
 
-was_speaking = False
-silence_samples = 0
+    def _emit(self):
+        # the buffer is reused for the next utterance, so the transcription
+        # stage gets its own copy
+        self.emit(self.buffer.view().copy())
+        self.buffer.clear()
 
-print("Speak now...")
+    def __call__(self, item):
+        # audio_vad is None for blocks the energy gate classified as silence
+        audio_raw, audio_vad = item
 
-with sd.InputStream(
-    callback=audio_callback,
-    blocksize=int(SAMPLE_RATE * BLOCK_DURATION),
-):
-    while True:
-        raw = audio_q.get()
+        volume = max(audio_raw.max(), -audio_raw.min())
+        print(f"\rMic level: {volume:.3f}", end="")
 
-        audio_t = torch.from_numpy(raw).unsqueeze(0)
-        with torch.no_grad():
-            denoised_t = enhance(df_model, df_state, audio_t)
+        if audio_vad is None:
+            events = self.vad.skip(len(audio_raw))
+        else:
+            events = self.vad.process(audio_vad)
+
+        for event, _ in events:
+            if event == "start":
+                self.speaking = True
+                self._since_partial = 0
+                self.buffer.clear()
+                self.buffer.write(self.pre_roll.view())
+                continue
 
-        audio_vad = denoised_t.squeeze(0).numpy()
-        audio_raw = raw
+            self.speaking = False
+            if len(self.buffer) >= SAMPLE_RATE * MIN_SPEECH_SEC:
+                self._emit()
+            self.buffer.clear()
 
-        volume = np.max(np.abs(audio_raw))
-        print(f"\rMic level: {volume:.3f}", end="")
+        self.pre_roll.write(audio_raw)
 
-        vad_buffer = np.concatenate([vad_buffer, audio_vad])
-        max_vad_len = int(SAMPLE_RATE * VAD_WINDOW_SEC)
-        if len(vad_buffer) > max_vad_len:
-            vad_buffer = vad_buffer[-max_vad_len:]
+        if not self.speaking:
+            return
 
-        speech = get_speech_timestamps(
-            torch.from_numpy(vad_buffer),
-            vad_model,
-            sampling_rate=SAMPLE_RATE,
-            threshold=0.2
+        # emit before a block would wrap the ring buffer and overwrite the
+        # start of the utterance
+        if len(self.buffer) + len(audio_raw) > self.buffer.capacity:
+            self._emit()
+        self.buffer.write(audio_raw)
+
+        if self.buffer.full:
+            self._emit()
+            return
+
+        self._since_partial += len(audio_raw)
+        if (
+            self.emit_partial is not None
+            and self._since_partial >= SAMPLE_RATE * PARTIAL_INTERVAL_SEC
+            and len(self.buffer) >= SAMPLE_RATE * MIN_SPEECH_SEC
+        ):
+            self._since_partial = 0
+            self.emit_partial(self.buffer.view())
+
+
+class VoicePipeline:
+    # capture -> denoise -> VAD/segmentation -> transcription -> NL->SQL,
+    # each stage on its own thread behind a bounded queue, so a long
+    # whisper decode or HTTP call never backs up into audio capture
+    def __init__(
+        self,
+        on_transcript=on_final_transcript,
+        on_partial=on_partial_transcript,
+    ):
+        self.on_partial = on_partial
+        self.agreement = LocalAgreement(PARTIAL_AGREEMENT)
+
+        self.sql = Stage("nl_sql", on_transcript, SQL_QUEUE_TRANSCRIPTS)
+        self.asr = Stage("transcribe", self._transcribe, ASR_QUEUE_UTTERANCES)
+        self.segment = Stage("vad", self._segment, SEGMENT_QUEUE_FRAMES)
+        self.denoise = Stage(
+            "denoise",
+            self._denoise,
+            max(CAPTURE_QUEUE_BLOCKS, int(STARTUP_BUFFER_SEC / BLOCK_DURATION)),
+        )
+        # built by _warm() once the models are loaded
+        self.denoiser = None
+        self.segmenter = None
+        self.gate = EnergyGate(
+            rms_threshold=GATE_RMS_THRESHOLD,
+            max_zcr=GATE_MAX_ZCR,
+            hangover_blocks=int(GATE_HANGOVER_SEC / BLOCK_DURATION),
         )
+        self.stages = [self.denoise, self.segment, self.asr, self.sql]
+
+    def _warm(self):
+        # runs on the denoise thread at the first captured block; capture
+        # keeps queueing audio meanwhile, which is replayed once ready
+        models.wait()
+        _, _, df_state = models.get("deepfilternet")
+        self.denoiser = BatchedDenoiser(
+            denoise,
+            hop_aligned(int(SAMPLE_RATE * DENOISE_FRAME_SEC), df_state.hop_size()),
+        )
+        self.segmenter = Segmenter(
+            lambda audio: self.asr.put(("final", audio)),
+            self._request_partial if STREAMING_PARTIALS else None,
+        )
+        self.denoise.resize(CAPTURE_QUEUE_BLOCKS)
+
+    def _segment(self, frame):
+        self.segmenter(frame)
 
-        if speech:
-            buffer = np.concatenate([buffer, audio_raw])
-            was_speaking = True
-            silence_samples = 0
-
-            if len(buffer) >= MAX_SAMPLES:
-                segments, _ = whisper.transcribe(
-                    buffer,
-                    beam_size=5,
-                    condition_on_previous_text=False,
-                    temperature=0.0,
-                    no_speech_threshold=0.6,
-                )
-
-                texts = [
-                    seg.text for seg in segments
-                    if is_confident_segment(seg)
-                ]
-
-                if texts:
-                    on_final_transcript(" ".join(texts))
-                else:
-                    print("\n[discarded low-confidence audio]")
-
-                buffer = np.zeros(0, dtype=np.float32)
-                was_speaking = False
+    def _denoise(self, raw: np.ndarray):
+        if self.denoiser is None:
+            self._warm()
 
+        if self.gate(raw):
+            frames = self.denoiser.process(raw)
         else:
-            if not was_speaking:
-                continue
+            # keep ordering: any half-filled frame goes out before silence
+            frames = self.denoiser.flush()
+            frames.append((raw, None))
+
+        for frame in frames:
+            self.segment.put(frame)
+
+    def _request_partial(self, audio: np.ndarray):
+        # partials are best-effort: only decode one when the transcription
+        # stage is idle (nothing queued or being decoded), so they never
+        # delay a final transcript
+        if self.asr.idle:
+            self.asr.put(("partial", audio.copy()))
+
+    def _transcribe(self, item):
+        kind, audio = item
+
+        if kind == "partial":
+            prefix = " ".join(self.agreement.committed)
+            committed, tentative = self.agreement.extend(
+                transcribe_partial(audio, prefix)
+            )
+            if self.on_partial is not None:
+                self.on_partial(committed, tentative)
+            return
 
-            silence_samples += len(audio_raw)
+        self.agreement.reset()
+        text = transcribe(audio)
+        if text:
+            self.sql.put(text)
 
-            if silence_samples < SAMPLE_RATE * SILENCE_END_SEC:
-                continue
+    def feed(self, raw: np.ndarray):
+        self.denoise.put(raw)
 
-            was_speaking = False
-            silence_samples = 0
+    def audio_callback(self, indata, frames, time_info, status):
+        if status:
+            print(status)
 
-            if len(buffer) < SAMPLE_RATE * MIN_SPEECH_SEC:
-                buffer = np.zeros(0, dtype=np.float32)
-                continue
+        # one copy per block: the queue must own its data
+        self.feed(indata[:, 0].astype(np.float32))
 
-            segments, _ = whisper.transcribe(
-                buffer,
-                beam_size=5,
-                condition_on_previous_text=False,
-                temperature=0.0,
-                no_speech_threshold=0.6,
-            )
+    def start(self):
+        models.start()
+        for stage in reversed(self.stages):
+            stage.start()
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
 
-            texts = [
-                seg.text for seg in segments
-                if is_confident_segment(seg)
-            ]
+    def stats(self) -> list[dict]:
+        return [stage.stats() for stage in self.stages]
+
+
+def main():
+    started = time.monotonic()
+    pipeline = VoicePipeline()
+    pipeline.start()
+
+    try:
+        with sd.InputStream(
+            callback=pipeline.audio_callback,
+            blocksize=int(SAMPLE_RATE * BLOCK_DURATION),
+        ):
+            print(
+                f"Capturing after {time.monotonic() - started:.2f}s, "
+                "audio is buffered while models load..."
+            )
+            models.wait()
+            print(models.format_timings())
+            print("Speak now...")
+
+            while True:
+                time.sleep(STATS_INTERVAL_SEC)
+                print("\n" + format_stats(pipeline.stats()))
+                print(f"[ASR TIERS] {models.get('transcriber').stats}")
+                print(f"[NL->SQL] {nl_sql.stats()} cache={sql_cache.stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+        nl_sql.close()
+        print("\n" + format_stats(pipeline.stats()))
 
-            if texts:
-                on_final_transcript(" ".join(texts))
-            else:
-                print("\n[discarded low-confidence audio]")
 
-            buffer = np.zeros(0, dtype=np.float32)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from rapidfuzz import fuzz
+except ImportError:
+    fuzz = None
+
+NL_SQL_TIMEOUT_SEC = (3.05, 10.0)  # connect, read
+NL_SQL_RETRIES = 2
+NL_SQL_BACKOFF_SEC = 0.25
+NL_SQL_BACKOFF_MAX_SEC = 2.0
+NL_SQL_POOL_SIZE = 4
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# speculative requests still in flight or unclaimed; the oldest is
+# forgotten past this
+MAX_SPECULATIVE = 4
+
+SQL_CACHE_SIZE = 256
+SQL_CACHE_TTL_SEC = 24 * 3600
+# "" keeps the transcript cache in memory only
+SQL_CACHE_PATH = os.environ.get("SQL_CACHE_PATH", "")
+
+# a cached question is reused for a near-duplicate one when, ignoring
+# filler words, they score at least FUZZY_MIN_SCORE and every word only one
+# side has is filler or a respelling (NEAR_WORD_SCORE) of a schema word on
+# the other. Anything else may be a value ("Austria" is not "Australia")
+# and has to match exactly
+FUZZY_MIN_SCORE = 90
+NEAR_WORD_SCORE = 85
+FILLER_WORDS = {
+    "a", "an", "the", "please", "me", "us", "can", "could", "you", "would",
+    "show", "list", "give", "get", "tell", "what", "are", "is", "of", "all",
+    "um", "uh", "so", "just", "now",
+}
+
+_PUNCT_RE = re.compile(r"[^\w\s']+")
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    # partial and final decodes differ in casing and punctuation
+    return _WS_RE.sub(" ", _PUNCT_RE.sub(" ", text.lower())).strip()
+
+
+class _Retryable(Exception):
+    pass
+
+
+class NLSQLClient:
+    # One keep-alive session shared by every utterance. speculate() fires
+    # the request for a stable partial transcript in the background;
+    # resolve() reuses that response when the final transcript normalizes
+    # to the same question and otherwise makes a fresh request.
+
+    def __init__(
+        self,
+        endpoint: str,
+        role: str | None = None,
+        timeout=NL_SQL_TIMEOUT_SEC,
+        retries: int = NL_SQL_RETRIES,
+        backoff: float = NL_SQL_BACKOFF_SEC,
+        max_backoff: float = NL_SQL_BACKOFF_MAX_SEC,
+        pool_size: int = NL_SQL_POOL_SIZE,
+    ):
+        self.endpoint = endpoint
+        self.role = role
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="nl-sql"
+        )
+        self._speculative = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "retries": 0,
+            "speculated": 0,
+            "speculative_hits": 0,
+        }
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def generate(self, question: str) -> dict:
+        for attempt in range(self.retries + 1):
+            self._count("requests")
+            try:
+                r = self.session.post(
+                    self.endpoint,
+                    json={"question": question, "role": self.role},
+                    timeout=self.timeout,
+                )
+                if r.status_code in RETRY_STATUSES:
+                    raise _Retryable(f"HTTP {r.status_code}")
+                r.raise_for_status()
+                return r.json()
+            except (requests.ConnectionError, requests.Timeout, _Retryable):
+                if attempt == self.retries:
+                    raise
+
+            # full jitter, so clients that failed together retry apart
+            self._count("retries")
+            time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def speculate(self, question: str):
+        key = normalize_question(question)
+        if not key:
+            return
+
+        with self._lock:
+            if key in self._speculative:
+                return
+            while len(self._speculative) >= MAX_SPECULATIVE:
+                self._speculative.popitem(last=False)
+            self._speculative[key] = self._executor.submit(self.generate, question)
+            self._stats["speculated"] += 1
+
+    def resolve(self, question: str) -> dict:
+        key = normalize_question(question)
+        with self._lock:
+            future = self._speculative.pop(key, None)
+            # speculations for earlier partials of this utterance are stale
+            self._speculative.clear()
+
+        if future is not None:
+            try:
+                data = future.result()
+            except Exception:
+                pass
+            else:
+                self._count("speculative_hits")
+                return data
+
+        return self.generate(question)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+def _ratio(a: str, b: str) -> float:
+    if fuzz is not None:
+        return fuzz.ratio(a, b)
+    return SequenceMatcher(None, a, b).ratio() * 100
+
+
+def _token_score(a: str, b: str) -> float:
+    if fuzz is not None:
+        return fuzz.token_sort_ratio(a, b)
+    return _ratio(" ".join(sorted(a.split())), " ".join(sorted(b.split())))
+
+
+def _content(text: str) -> str:
+    return " ".join(w for w in text.split() if w not in FILLER_WORDS) or text
+
+
+def _same_question(a: str, b: str, vocabulary=None) -> bool:
+    # vocabulary(word) says whether a word names part of the schema
+    words_a, words_b = set(a.split()), set(b.split())
+    only_a, only_b = words_a - words_b, words_b - words_a
+
+    for word, others in [(w, only_b) for w in only_a] + [(w, only_a) for w in only_b]:
+        if word in FILLER_WORDS:
+            continue
+        # "top 10" and "top 100" are different questions
+        if any(c.isdigit() for c in word) or vocabulary is None:
+            return False
+        if not any(
+            _ratio(word, o) >= NEAR_WORD_SCORE and (vocabulary(word) or vocabulary(o))
+            for o in others
+        ):
+            return False
+    return True
+
+
+class TranscriptCache:
+    # NL->SQL responses keyed on (role, schema, normalized question), LRU
+    # with a TTL. Only questions that name their schema are cached: a
+    # follow-up like "sort them by date" depends on the conversation.
+    # Without a vocabulary only filler words may differ in a fuzzy match.
+
+    def __init__(
+        self,
+        size: int = SQL_CACHE_SIZE,
+        ttl: float = SQL_CACHE_TTL_SEC,
+        path: str = SQL_CACHE_PATH,
+        min_score: float = FUZZY_MIN_SCORE,
+        vocabulary=None,
+    ):
+        self.size = size
+        self.ttl = ttl
+        self.path = path
+        self.min_score = min_score
+        self.vocabulary = vocabulary
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "fuzzy_hits": 0, "misses": 0}
+
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for role, schema, text, stored, data in json.load(f):
+                self._entries[(role, schema, text)] = (stored, data)
+        self._purge()
+
+    def _save(self):
+        entries = [
+            [role, schema, text, stored, data]
+            for (role, schema, text), (stored, data) in self._entries.items()
+        ]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)
+
+    def _purge(self):
+        cutoff = time.time() - self.ttl
+        for key in [k for k, (stored, _) in self._entries.items() if stored < cutoff]:
+            del self._entries[key]
+
+    def _find(self, key: tuple):
+        if key in self._entries:
+            return key, False
+
+        role, schema, text = key
+        best, best_score = None, self.min_score
+        for candidate in self._entries:
+            if candidate[0] != role or candidate[1] != schema:
+                continue
+            score = _token_score(_content(text), _content(candidate[2]))
+            if score >= best_score and _same_question(
+                text, candidate[2], self.vocabulary
+            ):
+                best, best_score = candidate, score
+        return best, True
+
+    def get(self, question: str, role: str | None, schema: str | None) -> dict | None:
+        if schema is None:
+            return None
+
+        with self._lock:
+            self._purge()
+            key, fuzzy = self._find((role, schema, normalize_question(question)))
+            if key is None:
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats["fuzzy_hits" if fuzzy else "hits"] += 1
+            return self._entries[key][1]
+
+    def has(self, question: str, role: str | None, schema: str | None) -> bool:
+        if schema is None:
+            return False
+        with self._lock:
+            self._purge()
+            key, _ = self._find((role, schema, normalize_question(question)))
+            return key is not None
+
+    def discard(self, question: str, role: str | None, schema: str | None):
+        # drops whatever get() would have answered with, e.g. SQL that no
+        # longer runs against the current schema
+        if schema is None:
+            return
+        with self._lock:
+            key, _ = self._find((role, schema, normalize_question(question)))
+            if key is None:
+                return
+            del self._entries[key]
+            if self.path:
+                self._save()
+
+    def put(self, question: str, role: str | None, schema: str | None, data: dict):
+        if schema is None or data.get("intent") != "sql":
+            return
+
+        with self._lock:
+            key = (role, schema, normalize_question(question))
+            self._entries[key] = (time.time(), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+            if self.path:
+                self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), **self._stats}
@@ -0,0 +1,238 @@
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+
+_STOP = object()
+
+# stop() waits this long for the handler to finish its current item; the
+# worker is a daemon thread, so one still busy after that cannot block exit
+STAGE_STOP_TIMEOUT_SEC = 5.0
+
+
+class Stage:
+    # One worker thread draining a bounded queue. put() never blocks: when
+    # the queue is full the item is dropped and counted, so a slow stage
+    # can only lose its own input and never stalls the stage feeding it.
+
+    def __init__(self, name: str, handler, maxsize: int):
+        self.name = name
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=maxsize)
+
+        self._thread = None
+        self._stopping = threading.Event()
+        self._shrink_to = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "received": 0,
+            "processed": 0,
+            "dropped": 0,
+            "errors": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+            "service_total": 0.0,
+            "service_max": 0.0,
+        }
+
+    def put(self, item) -> bool:
+        if self._stopping.is_set():
+            return False
+        try:
+            self.queue.put_nowait((time.monotonic(), item))
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+            return False
+
+        with self._lock:
+            self._stats["received"] += 1
+        return True
+
+    def resize(self, maxsize: int):
+        # shrinking keeps whatever is already queued and only takes effect
+        # once the backlog has drained below the new bound; until then put()
+        # still accepts items up to the old size, so nothing new is dropped
+        with self.queue.mutex:
+            if maxsize < self.queue._qsize():
+                self._shrink_to = maxsize
+                return
+            self._shrink_to = None
+            self.queue.maxsize = maxsize
+            self.queue.not_full.notify_all()
+
+    def _apply_shrink(self):
+        with self.queue.mutex:
+            if self._shrink_to is not None and self.queue._qsize() < self._shrink_to:
+                self.queue.maxsize = self._shrink_to
+                self._shrink_to = None
+
+    def start(self):
+        # a fresh event per worker, so one that outlived stop() cannot
+        # carry on alongside its replacement
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._stopping,),
+            name=f"stage-{self.name}", daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float | None = STAGE_STOP_TIMEOUT_SEC):
+        # queued items are discarded rather than processed: a backlog
+        # waiting on a model that is still loading could take minutes
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._discard()
+        try:
+            self.queue.put_nowait((time.monotonic(), _STOP))
+        except queue.Full:
+            pass  # the worker still sees _stopping after its current item
+        self._thread.join(timeout)
+        self._thread = None
+        self._discard()
+
+    def _discard(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self.queue.task_done()
+
+    @property
+    def idle(self) -> bool:
+        # an item counts as unfinished from put() until its handler has
+        # returned, so a stage that just dequeued one is not idle
+        with self.queue.mutex:
+            return self.queue.unfinished_tasks == 0
+
+    def _run(self, stopping: threading.Event):
+        while True:
+            enqueued, item = self.queue.get()
+            if item is _STOP or stopping.is_set():
+                self.queue.task_done()
+                return
+            if self._shrink_to is not None:
+                self._apply_shrink()
+
+            started = time.monotonic()
+            ok = True
+            try:
+                self.handler(item)
+            except Exception:
+                ok = False
+                print(f"\n[{self.name} ERROR]")
+                traceback.print_exc()
+            finished = time.monotonic()
+
+            wait = started - enqueued
+            service = finished - started
+            with self._lock:
+                s = self._stats
+                s["processed" if ok else "errors"] += 1
+                s["wait_total"] += wait
+                s["wait_max"] = max(s["wait_max"], wait)
+                s["service_total"] += service
+                s["service_max"] = max(s["service_max"], service)
+            self.queue.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        done = max(s["processed"] + s["errors"], 1)
+        return {
+            "name": self.name,
+            "queued": self.queue.qsize(),
+            "received": s["received"],
+            "processed": s["processed"],
+            "dropped": s["dropped"],
+            "errors": s["errors"],
+            "wait_avg_ms": s["wait_total"] / done * 1000,
+            "wait_max_ms": s["wait_max"] * 1000,
+            "service_avg_ms": s["service_total"] / done * 1000,
+            "service_max_ms": s["service_max"] * 1000,
+        }
+
+
+class BackgroundLoader:
+    # Named loaders that all start on their own threads at start(). get()
+    # blocks until that one is ready and re-raises its load error; loaders
+    # may get() each other. Start/ready offsets are kept for a startup report.
+
+    def __init__(self):
+        self._loaders = {}
+        self._futures = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+        self._started = None
+
+    def register(self, name: str, loader):
+        self._loaders[name] = loader
+
+    def start(self):
+        with self._lock:
+            if self._started is not None:
+                return
+            self._started = time.monotonic()
+            for name, loader in self._loaders.items():
+                self._futures[name] = Future()
+                threading.Thread(
+                    target=self._load,
+                    args=(name, loader),
+                    name=f"load-{name}",
+                    daemon=True,
+                ).start()
+
+    def _load(self, name: str, loader):
+        started = time.monotonic()
+        value = error = None
+        try:
+            value = loader()
+        except BaseException as e:
+            error = e
+        self._timings[name] = (
+            started - self._started,
+            time.monotonic() - self._started,
+        )
+
+        if error is not None:
+            self._futures[name].set_exception(error)
+        else:
+            self._futures[name].set_result(value)
+
+    def get(self, name: str):
+        self.start()
+        return self._futures[name].result()
+
+    def ready(self) -> bool:
+        return self._started is not None and all(
+            f.done() for f in self._futures.values()
+        )
+
+    def wait(self):
+        for name in self._loaders:
+            self.get(name)
+
+    def format_timings(self) -> str:
+        timings = dict(self._timings)
+        lines = ["[STARTUP]"]
+        for name, (started, ready) in sorted(timings.items(), key=lambda t: t[1][1]):
+            lines.append(
+                f"  {name:<14} {ready - started:6.2f}s  (ready at {ready:.2f}s)"
+            )
+        return "\n".join(lines)
+
+
+def format_stats(stats: list[dict]) -> str:
+    lines = ["[PIPELINE]"]
+    for s in stats:
+        lines.append(
+            f"  {s['name']:<11} queued={s['queued']:<4} "
+            f"done={s['processed']:<7} dropped={s['dropped']:<5} "
+            f"errors={s['errors']:<3} "
+            f"wait={s['wait_avg_ms']:.1f}/{s['wait_max_ms']:.1f}ms "
+            f"service={s['service_avg_ms']:.1f}/{s['service_max_ms']:.1f}ms"
+        )
+    return "\n".join(lines)
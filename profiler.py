@@ -0,0 +1,125 @@
+import argparse
+import json
+import re
+import threading
+from collections import deque
+
+PROFILE_LOG_PATH = "query_profile.jsonl"
+PROFILE_RING_SIZE = 1000
+PLAN_CACHE_SIZE = 512
+
+_SHAPE_RE = re.compile(
+    r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\?|:\w+",
+)
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WS_RE = re.compile(r"\s+")
+
+
+def query_shape(sql: str) -> str:
+    # literals and parameters become "?" so queries differing only in
+    # their constants are grouped together
+    shape = _SHAPE_RE.sub("?", sql)
+    shape = _IN_LIST_RE.sub("(?)", shape)
+    return _WS_RE.sub(" ", shape).strip()
+
+
+class QueryProfiler:
+    def __init__(
+        self,
+        path: str | None = PROFILE_LOG_PATH,
+        ring_size: int = PROFILE_RING_SIZE,
+        explain: bool = True,
+    ):
+        self.path = path
+        self.explain = explain
+        self.records = deque(maxlen=ring_size)
+
+        self._lock = threading.Lock()
+        self._plans: dict[str, list] = {}
+
+    def cached_plan(self, sql: str):
+        with self._lock:
+            return self._plans.get(sql)
+
+    def remember_plan(self, sql: str, plan: list):
+        with self._lock:
+            if len(self._plans) >= PLAN_CACHE_SIZE:
+                self._plans.pop(next(iter(self._plans)))
+            self._plans[sql] = plan
+
+    def record(self, record: dict):
+        record["shape"] = query_shape(record["sql"])
+        line = json.dumps(record, default=str)
+
+        with self._lock:
+            self.records.append(record)
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+
+    def recent(self) -> list[dict]:
+        with self._lock:
+            return list(self.records)
+
+
+def load_records(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records, top: int = 10) -> list[dict]:
+    shapes = {}
+    for r in records:
+        shape = r.get("shape") or query_shape(r["sql"])
+        s = shapes.setdefault(shape, {
+            "shape": shape,
+            "count": 0,
+            "errors": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "rows": 0,
+            "vm_steps": 0,
+            "plan": None,
+        })
+        s["count"] += 1
+        s["errors"] += 1 if r.get("error") else 0
+        s["total_ms"] += r["wall_ms"]
+        s["max_ms"] = max(s["max_ms"], r["wall_ms"])
+        s["rows"] += r.get("rows", 0)
+        s["vm_steps"] += r.get("vm_steps", 0)
+        if r.get("plan"):
+            s["plan"] = r["plan"]
+
+    for s in shapes.values():
+        s["avg_ms"] = s["total_ms"] / s["count"]
+
+    return sorted(shapes.values(), key=lambda s: -s["total_ms"])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="List the slowest query shapes from a profile log"
+    )
+    parser.add_argument("--log", default=PROFILE_LOG_PATH)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--sort", choices=["total", "avg", "max"], default="total",
+    )
+    args = parser.parse_args()
+
+    shapes = summarize(load_records(args.log), top=None)
+    shapes.sort(key=lambda s: -s[f"{args.sort}_ms"])
+
+    for s in shapes[:args.top]:
+        print(
+            f"{s['total_ms']:10.2f} ms total  {s['avg_ms']:8.2f} avg  "
+            f"{s['max_ms']:8.2f} max  x{s['count']:<5} "
+            f"rows={s['rows']} steps={s['vm_steps']} errors={s['errors']}"
+        )
+        print(f"    {s['shape']}")
+        for detail in s["plan"] or []:
+            print(f"      plan: {detail}")
+
+
+if __name__ == "__main__":
+    main()
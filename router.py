@@ -1,10 +1,288 @@
-def detect_schema(question: str, prev_schema: str | None = None) -> str | None:
-    q = question.lower()
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from schemas import SCHEMAS, registry
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# table names and hand-written synonyms say more about the schema than a
+# column or description word; a keyword shared by several schemas has its
+# weight split between them
+TABLE_WEIGHT = 2.0
+SYNONYM_WEIGHT = 2.0
+COLUMN_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 1.0
+
+# too generic to route on by themselves (as column-name parts or in
+# descriptions); whole column names like "first_name" still count
+GENERIC_WORDS = {
+    "id", "name", "text", "first", "last", "type", "date", "data", "info",
+    "and", "or", "the", "of", "for", "with", "a", "an", "to", "in",
+}
+
+# semantic routing is consulted only when the keywords are inconclusive,
+# and only when enabled and sentence-transformers is installed
+SEMANTIC_ROUTING = os.environ.get("ROUTER_SEMANTIC", "0") == "1"
+EMBEDDING_MODEL = os.environ.get(
+    "ROUTER_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+EMBEDDING_CACHE_DIR = ".router_cache"
+MIN_SEMANTIC_SIMILARITY = 0.3
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith(("sses", "uses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def _pattern(stem: str) -> str:
+    if stem.endswith("y"):
+        return re.escape(stem[:-1]) + r"(?:y|ies)"
+    return re.escape(stem) + r"(?:e?s)?"
+
+
+def _canonical(phrase: str) -> str:
+    return " ".join(_stem(w) for w in _WORD_RE.findall(phrase.lower()))
+
+
+class SchemaRouter:
+    # Every keyword of every schema is compiled into one word-bounded
+    # regex, so a question is scored against all schemas in a single scan.
+    # Plurals are folded onto the singular on both sides.
+
+    def __init__(self, schemas: dict):
+        weights = {}
+
+        def add(phrase: str, schema: str, weight: float):
+            key = _canonical(phrase)
+            if key:
+                entry = weights.setdefault(key, {})
+                entry[schema] = max(entry.get(schema, 0.0), weight)
+
+        for schema, spec in schemas.items():
+            for word in _WORD_RE.findall(spec.get("description", "").lower()):
+                if word not in GENERIC_WORDS:
+                    add(word, schema, DESCRIPTION_WEIGHT)
+
+            for synonym in spec.get("synonyms", []):
+                add(synonym, schema, SYNONYM_WEIGHT)
+
+            for table, table_spec in spec["tables"].items():
+                add(table, schema, TABLE_WEIGHT)
+                for column in table_spec["columns"]:
+                    parts = _WORD_RE.findall(column.lower())
+                    if len(parts) > 1:
+                        add(" ".join(parts), schema, COLUMN_WEIGHT)
+                    for part in parts:
+                        if part not in GENERIC_WORDS:
+                            add(part, schema, COLUMN_WEIGHT)
+
+        self.keywords = {
+            key: {s: w / len(entry) for s, w in entry.items()}
+            for key, entry in weights.items()
+        }
+        self.words = {word for key in self.keywords for word in key.split()}
+
+        # longest phrases first so "first name" wins over "first"
+        alternatives = [
+            r"[\s_]+".join(_pattern(stem) for stem in key.split())
+            for key in sorted(self.keywords, key=lambda k: (-len(k), k))
+        ]
+        self.regex = re.compile(
+            r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE
+        ) if alternatives else None
+
+    def rank(self, question: str) -> list[tuple[str, float]]:
+        if self.regex is None:
+            return []
+
+        scores = {}
+        for m in self.regex.finditer(question):
+            for schema, weight in self.keywords.get(_canonical(m.group()), {}).items():
+                scores[schema] = scores.get(schema, 0.0) + weight
+
+        total = sum(scores.values())
+        return sorted(
+            ((schema, score / total) for schema, score in scores.items()),
+            key=lambda item: (-item[1], item[0]),
+        )
+
+
+def _schema_texts(schemas: dict) -> tuple[list[str], list[str]]:
+    texts, owners = [], []
+
+    def add(text: str, schema: str):
+        texts.append(text.replace("_", " "))
+        owners.append(schema)
+
+    for schema, spec in schemas.items():
+        if spec.get("description"):
+            add(spec["description"], schema)
+        if spec.get("synonyms"):
+            add(", ".join(spec["synonyms"]), schema)
+        for table, table_spec in spec["tables"].items():
+            columns = list(table_spec["columns"])
+            add(f"{table} table with {', '.join(columns)}", schema)
+            for column in columns:
+                add(f"{column} of {table}", schema)
+    return texts, owners
 
-    if any(w in q for w in ["customer", "order", "shipping", "bought"]):
-        return "commerce"
 
-    if any(w in q for w in ["employee", "department", "salary"]):
-        return "hr"
+class SemanticRouter:
+    # One normalized embedding per schema description, table and column,
+    # cached on disk under the model name and a hash of the texts. A
+    # question scores each schema by its best cosine similarity.
+
+    def __init__(
+        self,
+        schemas: dict,
+        model_name: str = EMBEDDING_MODEL,
+        cache_dir: str = EMBEDDING_CACHE_DIR,
+        model=None,
+    ):
+        import numpy as np
+
+        texts, owners = _schema_texts(schemas)
+        self.schemas = list(dict.fromkeys(owners))
+        self.owners = np.array([self.schemas.index(o) for o in owners])
+        self.model = model or SentenceTransformer(model_name, device="cpu")
+
+        digest = hashlib.sha1(
+            json.dumps([model_name, texts]).encode("utf-8")
+        ).hexdigest()[:16]
+        path = os.path.join(
+            cache_dir, f"{re.sub(r'[^A-Za-z0-9]+', '_', model_name)}-{digest}.npz"
+        )
+
+        if os.path.exists(path):
+            self.vectors = np.load(path)["vectors"]
+        else:
+            self.vectors = self.model.encode(
+                texts, normalize_embeddings=True, convert_to_numpy=True
+            )
+            os.makedirs(cache_dir, exist_ok=True)
+            np.savez(path, vectors=self.vectors)
+
+    def rank(self, question: str) -> list[tuple[str, float]]:
+        import numpy as np
+
+        q = self.model.encode(
+            [question], normalize_embeddings=True, convert_to_numpy=True
+        )[0]
+        similarities = self.vectors @ q
+
+        best = np.full(len(self.schemas), -1.0)
+        np.maximum.at(best, self.owners, similarities)
+        return sorted(
+            ((schema, float(score)) for schema, score in zip(self.schemas, best)),
+            key=lambda item: (-item[1], item[0]),
+        )
+
+
+# both routers are rebuilt whenever the registry reports a schema change
+_router = None
+_router_version = None
+_semantic = None
+_semantic_version = None
+_lock = threading.Lock()
+# loading the embedding model takes seconds; _lock is not held meanwhile
+_semantic_build_lock = threading.Lock()
+
+
+def _current_schemas() -> tuple[dict, int | None]:
+    # the live registry, or the hand-written hints if the database
+    # cannot be read
+    try:
+        return registry.get(), registry.version
+    except sqlite3.Error:
+        return SCHEMAS, None
+
+
+def keyword_router() -> SchemaRouter:
+    global _router, _router_version
+    schemas, version = _current_schemas()
+    with _lock:
+        if _router is None or version != _router_version:
+            _router = SchemaRouter(schemas)
+            _router_version = version
+        return _router
+
+
+def semantic_router() -> SemanticRouter | None:
+    # built on first use (or ahead of time by calling this at startup)
+    global _semantic, _semantic_version
+    if not SEMANTIC_ROUTING or SentenceTransformer is None:
+        return None
+
+    schemas, version = _current_schemas()
+    with _lock:
+        if _semantic is not None and version == _semantic_version:
+            return _semantic
+
+    with _semantic_build_lock:
+        # another thread may have built it while this one waited
+        with _lock:
+            current = _semantic
+            if current is not None and version == _semantic_version:
+                return current
+
+        router = SemanticRouter(
+            schemas, model=current.model if current else None
+        )
+        with _lock:
+            _semantic = router
+            _semantic_version = version
+        return router
+
+
+def _semantic_choice(question: str, candidates: list[str] | None) -> str | None:
+    router = semantic_router()
+    if router is None:
+        return None
+    for schema, similarity in router.rank(question):
+        if similarity < MIN_SEMANTIC_SIMILARITY:
+            return None
+        if candidates is None or schema in candidates:
+            return schema
+    return None
+
+
+def is_schema_word(word: str) -> bool:
+    # a table, column, synonym or description word of any schema
+    return _stem(word.lower()) in keyword_router().words
+
+
+def rank_schemas(question: str) -> list[tuple[str, float]]:
+    # (schema, confidence) best first; confidences sum to 1
+    return keyword_router().rank(question)
+
+
+def detect_schema(question: str, prev_schema: str | None = None) -> str | None:
+    ranked = rank_schemas(question)
+    if not ranked:
+        return _semantic_choice(question, None) or prev_schema
+
+    best = ranked[0][1]
+    tied = [schema for schema, confidence in ranked if confidence == best]
+    if len(tied) == 1:
+        return tied[0]
 
-    return prev_schema
+    # ambiguous: keep the conversation's schema when it is a candidate,
+    # then ask the embeddings; otherwise there is nothing to go on
+    if prev_schema in tied:
+        return prev_schema
+    return _semantic_choice(question, tied)
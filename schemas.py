@@ -1,6 +1,18 @@
+import sqlite3
+import threading
+
+DB_PATH = "database.sqlite"
+
+# group for tables the database has but SCHEMAS does not mention
+UNGROUPED_SCHEMA = "other"
+
 SCHEMAS = {
     "commerce": {
         "description": "Customers, orders, and shipping data",
+        "synonyms": [
+            "bought", "buy", "purchase", "ordered", "client", "shipment",
+            "shipped", "delivery", "delivered", "product", "sale", "spent",
+        ],
         "tables": {
             "Customers": {
                 "columns": {
@@ -31,6 +43,10 @@ SCHEMAS = {
 
     "hr": {
         "description": "Employee and department data",
+        "synonyms": [
+            "salary", "staff", "payroll", "hire", "hired", "manager",
+            "team", "worker", "colleague",
+        ],
         "tables": {
             "Employees": {
                 "columns": {
@@ -49,3 +65,102 @@ SCHEMAS = {
         }
     }
 }
+
+
+class SchemaRegistry:
+    # SCHEMAS as the database actually is. Tables and column types come
+    # from sqlite_master and PRAGMA table_info; the hand-written SCHEMAS
+    # only contribute grouping, descriptions and synonyms, so declared
+    # tables that do not exist are dropped and undeclared ones land in
+    # UNGROUPED_SCHEMA. get() re-checks PRAGMA schema_version and re-reads
+    # only tables whose DDL changed; version counts structural changes.
+
+    def __init__(self, db_path: str = DB_PATH, hints: dict = SCHEMAS):
+        self.db_path = db_path
+        self.hints = hints
+        self.version = 0
+
+        self._conn = None
+        self._lock = threading.Lock()
+        self._schema_version = None
+        self._tables = {}
+        self._schemas = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(
+                f"file:{self.db_path}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+        return self._conn
+
+    def get(self) -> dict:
+        with self._lock:
+            conn = self._connect()
+            (schema_version,) = conn.execute("PRAGMA schema_version").fetchone()
+            if schema_version != self._schema_version:
+                self._refresh(conn)
+                self._schema_version = schema_version
+            return self._schemas
+
+    def _refresh(self, conn: sqlite3.Connection):
+        tables = {}
+        for name, sql in conn.execute(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ):
+            cached = self._tables.get(name)
+            if cached is not None and cached[0] == sql:
+                tables[name] = cached
+                continue
+
+            quoted = name.replace('"', '""')
+            columns = {
+                row[1]: row[2]
+                for row in conn.execute(f'PRAGMA table_info("{quoted}")')
+            }
+            tables[name] = (sql, columns)
+
+        if tables != self._tables or not self.version:
+            self._tables = tables
+            self._schemas = self._group()
+            self.version += 1
+
+    def _group(self) -> dict:
+        actual = {name.lower(): name for name in self._tables}
+        placed = set()
+        schemas = {}
+
+        for schema, spec in self.hints.items():
+            tables = {}
+            for table in spec["tables"]:
+                name = actual.get(table.lower())
+                if name is not None and name not in placed:
+                    tables[name] = {"columns": dict(self._tables[name][1])}
+                    placed.add(name)
+
+            if tables:
+                schemas[schema] = {
+                    **{k: v for k, v in spec.items() if k != "tables"},
+                    "tables": tables,
+                }
+
+        rest = {
+            name: {"columns": dict(columns)}
+            for name, (_, columns) in self._tables.items()
+            if name not in placed
+        }
+        if rest:
+            # no description: its words would become routing keywords
+            schemas[UNGROUPED_SCHEMA] = {"tables": rest}
+        return schemas
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+registry = SchemaRegistry()
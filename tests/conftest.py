@@ -0,0 +1,28 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import client  # noqa: E402
+
+
+@pytest.fixture
+def db_copy(tmp_path):
+    # tests never touch the tracked database
+    path = tmp_path / "database.sqlite"
+    shutil.copy(os.path.join(ROOT, "database.sqlite"), path)
+    return str(path)
+
+
+@pytest.fixture
+def pool(db_copy, monkeypatch):
+    # the module-level pool and result cache, pointed at the copy
+    pool = client.ConnectionPool(db_copy)
+    monkeypatch.setattr(client, "_pool", pool)
+    monkeypatch.setattr(client, "_cache", client.ResultCache(path=db_copy))
+    yield pool
+    pool.close()
@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+import torch
+
+from audio import BatchedDenoiser, EnergyGate, RingBuffer, StreamingVAD, hop_aligned
+
+
+class StubVAD:
+    # speech probability is the frame's first sample
+    def __init__(self):
+        self.resets = 0
+        self.calls = 0
+
+    def reset_states(self):
+        self.resets += 1
+
+    def __call__(self, frame, sampling_rate):
+        self.calls += 1
+        return torch.tensor(float(frame[0]))
+
+
+def samples(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_ring_buffer_wraps_around():
+    buf = RingBuffer(5)
+    buf.write(samples(1, 2, 3))
+    assert not buf.full
+    assert buf.view().tolist() == [1, 2, 3]
+
+    buf.write(samples(4, 5, 6, 7))
+    assert buf.full
+    assert len(buf) == 5
+    assert buf.view().tolist() == [3, 4, 5, 6, 7]
+    assert buf.view(2).tolist() == [6, 7]
+    assert buf.view(10).tolist() == [3, 4, 5, 6, 7]
+
+
+def test_ring_buffer_oversized_write_and_clear():
+    buf = RingBuffer(3)
+    buf.write(samples(1))
+    buf.write(samples(2, 3, 4, 5, 6))
+    assert buf.view().tolist() == [4, 5, 6]
+    # the view is one contiguous slice, never a copy
+    assert buf.view().base is not None
+
+    buf.clear()
+    assert len(buf) == 0
+    assert buf.view().tolist() == []
+    buf.write(samples(7))
+    assert buf.view().tolist() == [7]
+
+
+def vad(**kwargs):
+    model = StubVAD()
+    kwargs = {"threshold": 0.5, "min_silence_ms": 2, "speech_pad_ms": 0, "frame_size": 4, **kwargs}
+    return model, StreamingVAD(model, sampling_rate=1000, **kwargs)
+
+
+def test_vad_start_and_end_events():
+    model, v = vad()
+    # frames: silence, speech, speech, silence, silence
+    audio = np.repeat(samples(0, 0.9, 0.9, 0, 0), 4)
+    assert v.process(audio) == [("start", 4), ("end", 16)]
+    assert model.calls == 5
+    assert not v.triggered
+
+
+def test_vad_carries_partial_frames_across_calls():
+    model, v = vad()
+    events = v.process(np.full(3, 0.9, np.float32))
+    assert events == [] and model.calls == 0
+    assert v.process(np.full(1, 0.9, np.float32)) == [("start", 0)]
+
+
+def test_vad_skip_ends_utterance_without_model():
+    model, v = vad()
+    v.process(np.full(4, 0.9, np.float32))
+    calls = model.calls
+    assert v.skip(12) == [("end", 8)]
+    assert model.calls == calls
+
+
+def test_vad_skip_resets_state_once_per_gap():
+    model, v = vad()
+    resets = model.resets
+    v.skip(8)
+    v.skip(8)
+    assert model.resets == resets + 1
+    v.process(np.zeros(4, np.float32))
+    v.skip(8)
+    assert model.resets == resets + 2
+
+
+def test_energy_gate_hangover():
+    gate = EnergyGate(rms_threshold=0.1, hangover_blocks=2)
+    loud = np.full(160, 0.5, np.float32)
+    quiet = np.zeros(160, np.float32)
+    assert [gate(b) for b in (quiet, loud, quiet, quiet, quiet)] == [
+        False, True, True, True, False,
+    ]
+    assert (gate.opened, gate.skipped) == (3, 2)
+
+
+@pytest.mark.parametrize("zcr_sign, expected", [(1, True), (-1, False)])
+def test_energy_gate_zero_crossings(zcr_sign, expected):
+    # between half and full threshold only low zero-crossing blocks count
+    gate = EnergyGate(rms_threshold=0.1, max_zcr=0.25, hangover_blocks=0)
+    block = np.full(160, 0.07, np.float32)
+    if zcr_sign < 0:
+        block[1::2] *= -1
+    assert gate(block) is expected
+
+
+def test_batched_denoiser_frames_and_flush():
+    calls = []
+
+    def enhance(raw):
+        calls.append(len(raw))
+        return raw * 2
+
+    den = BatchedDenoiser(enhance, frame_samples=4)
+    assert den.process(samples(1, 2, 3)) == []
+    frames = den.process(samples(4, 5, 6, 7, 8, 9))
+    assert [raw.tolist() for raw, _ in frames] == [[1, 2, 3, 4], [5, 6, 7, 8]]
+    assert frames[0][1].tolist() == [2, 4, 6, 8]
+
+    (raw, denoised), = den.flush()
+    assert raw.tolist() == [9] and denoised.tolist() == [18]
+    assert den.flush() == []
+    assert calls == [4, 4, 1]
+
+
+def test_hop_aligned():
+    assert hop_aligned(3840, 480) == 3840
+    assert hop_aligned(4000, 480) == 3840
+    assert hop_aligned(100, 480) == 480
@@ -0,0 +1,33 @@
+import pytest
+
+import client
+
+LONG_STREAM = (
+    "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 20000) "
+    "SELECT x, printf('%040d', x) FROM c"
+)
+
+
+def test_result_bytes_checked_while_fetching(pool):
+    watchdog = client._Watchdog(budget={"max_result_bytes": 10_000})
+    with pytest.raises(client.QueryBudgetExceeded) as e:
+        client._execute(LONG_STREAM, 20_000, False, watchdog)
+    assert e.value.budget == "result_bytes"
+    # abandoned after the first chunk over budget, not after all 20000 rows
+    assert watchdog.result_bytes < 100 * 1024
+
+
+def test_cache_is_per_role(pool):
+    sql = "SELECT * FROM Customers"
+    client.execute_sql(sql, role="admin")
+    budget = {"max_result_bytes": 1000}
+    with pytest.raises(client.QueryBudgetExceeded):
+        client._execute(sql, 100, True, client._Watchdog(role="admin", budget=budget))
+
+
+def test_stream_budget_is_per_chunk(pool, monkeypatch):
+    monkeypatch.setitem(client.ROLE_BUDGETS, "tiny", {"max_result_bytes": 64 * 1024})
+    streamed = sum(
+        len(rows) for _, rows in client.iter_sql(LONG_STREAM, as_tuples=True, role="tiny")
+    )
+    assert streamed == 20_000
@@ -0,0 +1,62 @@
+import json
+import struct
+
+import numpy as np
+
+from client import _columnar, encode_columnar
+
+
+def decode(buf: bytes) -> dict:
+    n = struct.unpack("<I", buf[4:8])[0]
+    header = json.loads(buf[8:8 + n])
+    base = 8 + n
+    out = {}
+    for spec in header["columns"]:
+        raw = buf[base + spec["offset"]:base + spec["offset"] + spec["nbytes"]]
+        if spec["type"] in ("utf8", "binary"):
+            offsets = np.frombuffer(raw, "<u4", header["rows"] + 1)
+            data = raw[offsets.nbytes:]
+            values = [data[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+            if spec["type"] == "utf8":
+                values = [v.decode("utf-8") for v in values]
+        elif spec["type"] == "json":
+            values = json.loads(raw)
+        else:
+            values = np.frombuffer(raw, "<i8" if spec["type"] == "int64" else "<f8").tolist()
+        out[spec["name"]] = (spec["type"], values)
+    return out
+
+
+def test_homogeneous_columns_are_typed():
+    columns = _columnar(("i", "f", "s"), [(1, 1.5, "a"), (2, 2.5, "bc")])
+    assert [columns[k].dtype.kind for k in "ifs"] == ["i", "f", "O"]
+    assert decode(encode_columnar(columns))["s"] == ("utf8", ["a", "bc"])
+
+
+def test_text_is_not_padded_to_its_longest_value():
+    columns = _columnar(("s",), [("x" * 5000,)] + [("y",)] * 999)
+    assert columns["s"].dtype == object
+    assert columns["s"].nbytes == 1000 * np.dtype(object).itemsize
+
+
+def test_empty_result_keeps_columns_untyped():
+    columns = _columnar(("a", "b"), [])
+    assert [c.dtype for c in columns.values()] == [object, object]
+    assert decode(encode_columnar(columns)) == {"a": ("json", []), "b": ("json", [])}
+
+
+def test_mixed_types_are_not_coerced():
+    columns = _columnar(("m",), [(1,), ("two",), (None,)])
+    assert columns["m"].dtype == object
+    assert columns["m"].tolist() == [1, "two", None]
+    assert decode(encode_columnar(columns))["m"] == ("json", [1, "two", None])
+
+
+def test_blobs_round_trip():
+    blobs = [b"\x00ab\x00", b"\xff"]
+    columns = _columnar(("b",), [(v,) for v in blobs])
+    assert columns["b"].tolist() == blobs
+    assert decode(encode_columnar(columns))["b"] == ("binary", blobs)
+
+    mixed = _columnar(("b",), [(b"\x01",), (None,)])
+    assert decode(encode_columnar(mixed))["b"] == ("json", [{"base64": "AQ=="}, None])
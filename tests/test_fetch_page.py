@@ -0,0 +1,56 @@
+import pytest
+
+import client
+
+
+def all_pages(sql, **kwargs):
+    rows, token = [], None
+    while True:
+        page = client.fetch_page(sql, page_size=3, token=token, as_tuples=True, **kwargs)
+        rows += page["rows"]
+        token = page["next_token"]
+        if token is None:
+            return page["columns"], rows
+
+
+def test_default_key_returns_every_row(pool):
+    columns, rows = all_pages("SELECT country, first_name FROM Customers")
+    assert columns == ("country", "first_name")
+    assert len(rows) == 100
+
+
+def test_explicit_key(pool):
+    _, rows = all_pages("SELECT customer_id FROM Customers", key="customer_id")
+    assert [r[0] for r in rows] == sorted(r[0] for r in rows)
+    assert len(rows) == 100
+
+
+def test_rejects_duplicate_key(pool):
+    with pytest.raises(ValueError, match="not unique"):
+        all_pages("SELECT country, first_name FROM Customers", key="country")
+
+
+def test_rejects_null_key(pool):
+    with pytest.raises(ValueError, match="NULL"):
+        all_pages("SELECT NULL AS k, 1 AS x", key="k")
+
+
+def test_token_belongs_to_query(pool):
+    page = client.fetch_page("SELECT customer_id FROM Customers", page_size=3)
+    with pytest.raises(ValueError, match="does not belong"):
+        client.fetch_page("SELECT first_name FROM Customers", token=page["next_token"])
+
+
+def test_default_key_keeps_statement_order(pool):
+    sql = "SELECT order_id, amount FROM Orders ORDER BY amount DESC, order_id"
+    _, rows = all_pages(sql)
+    expected = client.execute_sql(sql, max_rows=1000, as_tuples=True, use_cache=False)[1]
+    assert rows == expected
+    assert rows[0][1] == max(r[1] for r in rows)
+
+
+def test_default_key_top_n(pool):
+    sql = "SELECT order_id, amount FROM Orders ORDER BY amount DESC LIMIT 7"
+    _, rows = all_pages(sql)
+    assert [r[1] for r in rows] == sorted((r[1] for r in rows), reverse=True)
+    assert len(rows) == 7
@@ -0,0 +1,39 @@
+from asr import LocalAgreement
+
+
+def test_commits_words_two_hypotheses_agree_on():
+    agreement = LocalAgreement(2)
+    assert agreement.update("show me") == ("", "show me")
+    assert agreement.update("show me all") == ("show me", "all")
+    assert agreement.update("show me all customers") == ("show me all", "customers")
+
+
+def test_agreement_ignores_case_and_punctuation():
+    agreement = LocalAgreement(2)
+    agreement.update("Show me,")
+    assert agreement.update("show me all")[0] == "show me"
+
+
+def test_committed_words_are_never_retracted():
+    agreement = LocalAgreement(2)
+    agreement.update("show me all")
+    agreement.update("show me all")
+    assert agreement.update("so meet") == ("show me all", "")
+
+
+def test_extend_with_prefix_stripped_continuations():
+    # a decode forced with the committed prefix returns only what follows
+    agreement = LocalAgreement(2)
+    agreement.update("show me")
+    assert agreement.update("show me all") == ("show me", "all")
+    assert agreement.extend("all customers") == ("show me all", "customers")
+    assert agreement.extend("customers from") == ("show me all customers", "from")
+    assert agreement.extend("from india") == ("show me all customers from", "india")
+
+
+def test_reset():
+    agreement = LocalAgreement(2)
+    agreement.update("show me")
+    agreement.update("show me")
+    agreement.reset()
+    assert agreement.update("list") == ("", "list")
@@ -0,0 +1,50 @@
+import sqlite3
+import threading
+
+import pytest
+
+import client
+
+
+@pytest.fixture
+def memory_pool(db_copy, monkeypatch):
+    pool = client.ConnectionPool(db_copy, open_mode="memory")
+    pool._replica.check_interval = 0.0
+    monkeypatch.setattr(client, "_pool", pool)
+    monkeypatch.setattr(client, "_cache", client.ResultCache(path=db_copy))
+    yield pool
+    pool.close()
+
+
+def test_cache_not_served_from_older_generation(memory_pool, db_copy):
+    sql = "SELECT count(*) FROM Orders"
+    before = client.execute_sql(sql, as_tuples=True)[1][0][0]
+
+    # the replica is stale until the next refresh, like a query that runs
+    # just before the interval elapses
+    memory_pool._replica.check_interval = 3600.0
+    writer = sqlite3.connect(db_copy)
+    writer.execute("DELETE FROM Orders WHERE order_id <= 19")
+    writer.commit()
+    writer.close()
+    assert client.execute_sql(sql, as_tuples=True)[1][0][0] == before
+
+    memory_pool._replica.check_interval = 0.0
+    assert client.execute_sql(sql, as_tuples=True)[1][0][0] == before - 19
+
+
+def test_concurrent_checks_rebuild_once(memory_pool, db_copy):
+    replica = memory_pool._replica
+    replica.refresh()
+    writer = sqlite3.connect(db_copy)
+    writer.execute("DELETE FROM Orders WHERE order_id = 1")
+    writer.commit()
+    writer.close()
+
+    refreshes = replica.refreshes
+    threads = [threading.Thread(target=replica.maybe_refresh) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert replica.refreshes == refreshes + 1
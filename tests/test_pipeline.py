@@ -0,0 +1,89 @@
+import threading
+import time
+
+from pipeline import Stage
+
+
+def test_stop_discards_backlog_and_times_out():
+    release = threading.Event()
+    handled = []
+
+    def handler(item):
+        handled.append(item)
+        release.wait()
+
+    stage = Stage("test", handler, maxsize=3000)
+    stage.start()
+    for i in range(2000):
+        stage.put(i)
+    while not handled:
+        time.sleep(0.001)
+
+    started = time.monotonic()
+    stage.stop(timeout=0.2)
+    assert time.monotonic() - started < 1.0
+    assert stage.queue.empty()
+    assert not stage.put("late")
+
+    release.set()
+    time.sleep(0.05)
+    assert handled == [0]
+
+
+def test_restart_after_stop():
+    handled = []
+    stage = Stage("test", handled.append, maxsize=10)
+    stage.start()
+    stage.stop()
+    stage.start()
+    stage.put(1)
+    deadline = time.monotonic() + 1.0
+    while not handled and time.monotonic() < deadline:
+        time.sleep(0.001)
+    stage.stop()
+    assert handled == [1]
+
+
+def test_idle_while_handling():
+    release = threading.Event()
+    stage = Stage("test", lambda item: release.wait(), maxsize=10)
+    assert stage.idle
+    stage.start()
+    stage.put(1)
+    while not stage.queue.empty():
+        time.sleep(0.001)
+    # dequeued but still in the handler
+    assert not stage.idle
+
+    release.set()
+    deadline = time.monotonic() + 1.0
+    while not stage.idle and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert stage.idle
+    stage.stop()
+
+
+def test_shrink_waits_for_backlog():
+    release = threading.Event()
+    stage = Stage("test", lambda item: release.wait(), maxsize=2000)
+    for i in range(1000):
+        stage.put(i)
+    stage.resize(100)
+    # still accepted while the startup backlog drains
+    assert all(stage.put(i) for i in range(50))
+    assert stage.queue.maxsize == 2000
+
+    release.set()
+    stage.start()
+    deadline = time.monotonic() + 2.0
+    while not stage.idle and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert stage.queue.maxsize == 100
+    assert stage.stats()["dropped"] == 0
+    stage.stop()
+
+
+def test_grow_applies_immediately():
+    stage = Stage("test", lambda item: None, maxsize=10)
+    stage.resize(100)
+    assert stage.queue.maxsize == 100
@@ -0,0 +1,18 @@
+import pytest
+
+from client import _query_lane
+
+
+@pytest.mark.parametrize("sql, lane", [
+    ("SELECT * FROM Customers WHERE customer_id = 1", "fast"),
+    ("SELECT first_name, last_name FROM Customers ORDER BY age, country", "fast"),
+    ("SELECT * FROM Customers WHERE country IN ('UK', 'USA')", "fast"),
+    ("SELECT substr(first_name, 1, 2) FROM Customers", "fast"),
+    ("SELECT count(*) FROM Orders a, Orders b, Orders c, Orders d", "slow"),
+    ("SELECT * FROM (SELECT * FROM Orders)", "slow"),
+    ("SELECT * FROM Customers WHERE customer_id IN (SELECT customer_id FROM Orders)", "slow"),
+    ("SELECT * FROM Orders JOIN Customers USING (customer_id)", "slow"),
+    ("SELECT country, count(*) FROM Customers GROUP BY country", "slow"),
+])
+def test_query_lane(sql, lane):
+    assert _query_lane(sql) == lane
@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+from client import ConnectionPool, _enforce_read_only, _read_only_violation
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT created_at FROM Orders",
+    "SELECT replacement_cost FROM Orders",
+    "SELECT updated_by, deleted FROM Customers",
+    "SELECT replace(first_name, 'a', 'b') FROM Customers",
+    "SELECT REPLACE (first_name, 'a', 'b') FROM Customers",
+    "SELECT * FROM Customers WHERE last_name = 'delete'",
+    'SELECT "drop" FROM Customers',
+    "SELECT 1 -- delete everything",
+    "SELECT 1; ",
+    "(SELECT 1)",
+    "WITH t AS (SELECT 1) SELECT * FROM t",
+    "VALUES (1), (2)",
+])
+def test_allowed(sql):
+    assert _read_only_violation(sql) is None
+
+
+@pytest.mark.parametrize("sql, violation", [
+    ("DELETE FROM Customers", "delete"),
+    ("REPLACE INTO Customers VALUES (1)", "replace"),
+    ("SELECT 1; DROP TABLE Customers", "multiple statements"),
+    ("SELECT 1; SELECT 2", "multiple statements"),
+    ("WITH t AS (SELECT 1) DELETE FROM Customers", "delete"),
+    ("ATTACH DATABASE 'x.db' AS x", "attach"),
+    ("PRAGMA writable_schema = ON", "pragma"),
+    ("", "empty statement"),
+    ("EXPLAIN SELECT 1", "explain"),
+])
+def test_forbidden(sql, violation):
+    assert _read_only_violation(sql) == violation
+
+
+def test_enforce_normalizes_comments():
+    _enforce_read_only("SELECT 1 /* ; DROP TABLE x */")
+    with pytest.raises(ValueError, match="Forbidden SQL operation"):
+        _enforce_read_only("SELECT 1;\n-- x\nDELETE FROM Customers")
+
+
+def test_authorizer_denies_writes(db_copy):
+    pool = ConnectionPool(db_copy)
+    try:
+        with pool.connection() as conn:
+            assert conn.execute("SELECT count(*) FROM Customers").fetchone()[0] == 100
+            conn.execute("PRAGMA data_version").fetchone()
+
+            for sql in (
+                "DELETE FROM Customers",
+                "CREATE TABLE t (x)",
+                "PRAGMA journal_mode = DELETE",
+                f"ATTACH DATABASE '{db_copy}' AS other",
+            ):
+                with pytest.raises(sqlite3.DatabaseError, match="not authorized"):
+                    conn.execute(sql)
+
+            assert conn.execute("SELECT count(*) FROM Customers").fetchone()[0] == 100
+    finally:
+        pool.close()
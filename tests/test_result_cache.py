@@ -0,0 +1,83 @@
+import os
+import sqlite3
+import time
+
+import client
+
+COUNT = "SELECT count(*) FROM Orders"
+
+
+def count():
+    return client.execute_sql(COUNT, as_tuples=True)[1][0][0]
+
+
+def write(path, sql="DELETE FROM Orders WHERE order_id <= 19"):
+    conn = sqlite3.connect(path)
+    conn.execute(sql)
+    conn.commit()
+    conn.close()
+
+
+def test_hit_then_miss_after_write(pool, db_copy):
+    before = count()
+    assert count() == before
+    assert client.cache_stats()["hits"] == 1
+
+    write(db_copy)
+    assert count() == before - 19
+    stats = client.cache_stats()
+    assert stats["hits"] == 1
+    assert stats["invalidations"] == 1
+
+
+def test_data_version_invalidates(pool, db_copy, monkeypatch):
+    # a writer the file fingerprint cannot see
+    monkeypatch.setattr(client, "_file_fingerprint", lambda path: "same")
+    before = count()
+    write(db_copy)
+    assert count() == before - 19
+    assert client.cache_stats()["invalidations"] == 1
+
+
+def test_fingerprint_invalidates(pool, db_copy):
+    count()
+    st = os.stat(db_copy)
+    os.utime(db_copy, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    count()
+    stats = client.cache_stats()
+    assert stats["hits"] == 0
+    assert stats["invalidations"] == 1
+
+
+def test_ttl_expiry():
+    cache = client.ResultCache(ttl=0.01)
+    cache.put("k", (("n",), [(1,)]))
+    assert cache.get("k") is not None
+    time.sleep(0.02)
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["rows"] == 0
+
+
+def test_row_bound_eviction():
+    cache = client.ResultCache(max_rows=5)
+    cache.put("a", (("n",), [(1,)] * 3))
+    cache.put("b", (("n",), [(2,)] * 3))
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+
+    # larger than the whole cache: not stored, nothing evicted for it
+    cache.put("c", (("n",), [(3,)] * 6))
+    assert cache.get("c") is None
+    assert cache.get("b") is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["rows"] == 3
+
+
+def test_entry_bound_eviction():
+    cache = client.ResultCache(max_entries=2)
+    for key in "abc":
+        cache.put(key, (("n",), [(1,)]))
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 2
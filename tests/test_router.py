@@ -0,0 +1,75 @@
+import pytest
+
+import router
+from router import SchemaRouter
+from schemas import SCHEMAS
+
+
+@pytest.fixture
+def hints(monkeypatch):
+    # route on the hand-written SCHEMAS rather than the live database
+    monkeypatch.setattr(router, "_current_schemas", lambda: (SCHEMAS, "hints"))
+    monkeypatch.setattr(router, "_router", None)
+    monkeypatch.setattr(router, "SEMANTIC_ROUTING", False)
+
+
+@pytest.mark.parametrize("question, schema", [
+    ("show all customers", "commerce"),
+    ("list every order", "commerce"),
+    ("Customer orders", "commerce"),
+    ("how many orders shipped", "commerce"),
+    ("list the deliveries", "commerce"),
+    ("countries of our clients", "commerce"),
+    ("what is the shipping_id of each order", "commerce"),
+    ("employees in each department", "hr"),
+    ("who has the highest salary", "hr"),
+    ("list department names", "hr"),
+])
+def test_rank_best_schema(question, schema):
+    ranked = SchemaRouter(SCHEMAS).rank(question)
+    assert ranked[0] == (schema, 1.0)
+
+
+@pytest.mark.parametrize("question", [
+    "cross the border",
+    "the bordering states",
+    "what is the weather",
+    "",
+])
+def test_no_keyword_no_schema(question):
+    # "order" inside "border" is not a keyword hit
+    assert SchemaRouter(SCHEMAS).rank(question) == []
+
+
+def test_plurals_fold_onto_singular():
+    r = SchemaRouter(SCHEMAS)
+    assert r.rank("one category of deliveries") == r.rank("one category of delivery")
+    assert r.rank("all employees") == r.rank("an employee")
+
+
+def test_confidences_sum_to_one_and_shared_words_split():
+    ranked = SchemaRouter(SCHEMAS).rank("customers per department")
+    assert dict(ranked) == {"commerce": 0.5, "hr": 0.5}
+    assert SchemaRouter(SCHEMAS).rank("show me the ages") == [
+        ("commerce", 0.5), ("hr", 0.5),
+    ]
+
+
+@pytest.mark.parametrize("question, prev, schema", [
+    ("show all customers", None, "commerce"),
+    ("show all customers", "hr", "commerce"),
+    # a tie keeps the conversation's schema when it is a candidate
+    ("customers per department", "hr", "hr"),
+    ("customers per department", None, None),
+    # nothing to route on: stay with the conversation
+    ("sort them by date", "hr", "hr"),
+    ("sort them by date", None, None),
+])
+def test_detect_schema(hints, question, prev, schema):
+    assert router.detect_schema(question, prev) == schema
+
+
+def test_is_schema_word(hints):
+    assert router.is_schema_word("Customers")
+    assert router.is_schema_word("salary")
+    assert not router.is_schema_word("india")
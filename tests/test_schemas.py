@@ -0,0 +1,22 @@
+import sqlite3
+
+from router import SchemaRouter
+from schemas import UNGROUPED_SCHEMA, SchemaRegistry
+
+
+def test_undeclared_tables_are_grouped_without_keywords(db_copy):
+    conn = sqlite3.connect(db_copy)
+    conn.execute("CREATE TABLE Audit (audit_id INTEGER, note TEXT)")
+    conn.commit()
+    conn.close()
+
+    registry = SchemaRegistry(db_copy)
+    try:
+        schemas = registry.get()
+    finally:
+        registry.close()
+
+    assert "Audit" in schemas[UNGROUPED_SCHEMA]["tables"]
+    router = SchemaRouter(schemas)
+    assert router.rank("list all tables") == []
+    assert router.rank("show audit notes")[0][0] == UNGROUPED_SCHEMA
@@ -0,0 +1,35 @@
+from nl_sql import TranscriptCache
+
+SQL = {"intent": "sql", "sql": "SELECT * FROM Customers WHERE country = 'Australia'"}
+SCHEMA_WORDS = {"customers", "country", "orders"}
+
+
+def cache(**kwargs):
+    c = TranscriptCache(vocabulary=lambda w: w in SCHEMA_WORDS, **kwargs)
+    c.put("show customers from australia", "admin", "crm", SQL)
+    return c
+
+
+def test_filler_words_and_respelt_schema_words_match():
+    c = cache()
+    assert c.get("please show me customers from australia", "admin", "crm") == SQL
+    assert c.get("show custmers from australia", "admin", "crm") == SQL
+
+
+def test_values_must_match_exactly():
+    c = cache()
+    assert c.get("show customers from austria", "admin", "crm") is None
+    assert c.get("show customers from australia", "sales", "crm") is None
+
+
+def test_without_vocabulary_only_filler_may_differ():
+    c = TranscriptCache()
+    c.put("show customers from australia", "admin", "crm", SQL)
+    assert c.get("please show customers from australia", "admin", "crm") == SQL
+    assert c.get("show custmers from australia", "admin", "crm") is None
+
+
+def test_discard():
+    c = cache()
+    c.discard("show custmers from australia", "admin", "crm")
+    assert c.get("show customers from australia", "admin", "crm") is None